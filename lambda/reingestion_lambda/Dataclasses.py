@@ -1,5 +1,8 @@
 from dataclasses import dataclass, field
+from typing import Callable
 from botocore.client import BaseClient
+from utils.firehose_batch_writer import FirehoseBatchWriter
+from reingestion_lambda.s3_spool import S3PayloadSpool
 
 
 @dataclass
@@ -10,6 +13,7 @@ class ProcessedBody:
     record_batch: list = field(default_factory=list)
     reingest_json: dict = field(default_factory=dict)
     sent_to_s3: bool = False
+    stopped_at_line: int = None
 
 
 @dataclass
@@ -28,6 +32,10 @@ class EventMetadata:
     MAX_INGEST: int
     bucket_name: str
     key: str
+    firehose_writer: FirehoseBatchWriter = None
+    s3_spool: S3PayloadSpool = None
+    start_line: int = 0
+    deadline_reached: Callable = None
 
 
 @dataclass
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from utils.cache import get_client
+
+
+DEFAULT_CHECKPOINT_MARGIN_MS = 15000
+# Checkpoints are only needed until the retries of an invocation have run.
+CHECKPOINT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+@dataclass
+class Checkpoint:
+    line_offset: int = 0
+    done: bool = False
+
+
+def get_object_id(bucket_name, key, etag):
+    return f"{bucket_name}/{key}/{etag}"
+
+
+def get_expires_at():
+    return int(time.time()) + CHECKPOINT_TTL_SECONDS
+
+
+class SqliteCheckpointStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints "
+                "(object_id TEXT PRIMARY KEY, line_offset INTEGER NOT NULL, "
+                "done INTEGER NOT NULL, expires_at INTEGER NOT NULL)"
+            )
+
+    def get(self, bucket_name, key, etag):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT line_offset, done FROM checkpoints "
+                "WHERE object_id = ? AND expires_at > ?",
+                (get_object_id(bucket_name, key, etag), int(time.time())),
+            ).fetchone()
+        return Checkpoint(row[0], bool(row[1])) if row else Checkpoint()
+
+    def put(self, bucket_name, key, etag, line_offset, done=False):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(object_id, line_offset, done, expires_at) VALUES (?, ?, ?, ?)",
+                (
+                    get_object_id(bucket_name, key, etag),
+                    line_offset,
+                    int(done),
+                    get_expires_at(),
+                ),
+            )
+
+    def mark_done(self, bucket_name, key, etag):
+        self.put(bucket_name, key, etag, 0, done=True)
+
+    def delete(self, bucket_name, key, etag):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM checkpoints WHERE object_id = ?",
+                (get_object_id(bucket_name, key, etag),),
+            )
+
+
+class DynamoDBCheckpointStore:
+    def __init__(self, table_name, client):
+        self.table_name = table_name
+        self.client = client
+
+    def get(self, bucket_name, key, etag):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"ObjectId": {"S": get_object_id(bucket_name, key, etag)}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        # DynamoDB deletes expired items some time after they expire.
+        if not item or int(item["ExpiresAt"]["N"]) <= time.time():
+            return Checkpoint()
+        return Checkpoint(
+            int(item["LineOffset"]["N"]), item.get("Done", {}).get("BOOL", False)
+        )
+
+    def put(self, bucket_name, key, etag, line_offset, done=False):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "ObjectId": {"S": get_object_id(bucket_name, key, etag)},
+                "LineOffset": {"N": str(line_offset)},
+                "Done": {"BOOL": done},
+                "ExpiresAt": {"N": str(get_expires_at())},
+            },
+        )
+
+    def mark_done(self, bucket_name, key, etag):
+        self.put(bucket_name, key, etag, 0, done=True)
+
+    def delete(self, bucket_name, key, etag):
+        self.client.delete_item(
+            TableName=self.table_name,
+            Key={"ObjectId": {"S": get_object_id(bucket_name, key, etag)}},
+        )
+
+
+def get_checkpoint_store():
+    checkpoint_table = os.environ.get("checkpoint_table")
+    if checkpoint_table:
+        return DynamoDBCheckpointStore(checkpoint_table, get_client("dynamodb"))
+
+    checkpoint_path = os.environ.get("checkpoint_path")
+    if checkpoint_path:
+        return SqliteCheckpointStore(checkpoint_path)
+
+    return None
+
+
+def get_checkpoint_margin_ms():
+    try:
+        checkpoint_margin_ms = int(os.environ["checkpoint_margin_ms"])
+    except Exception:
+        checkpoint_margin_ms = DEFAULT_CHECKPOINT_MARGIN_MS
+    return checkpoint_margin_ms
@@ -1,5 +1,6 @@
-import json
-import base64
+import binascii
+from utils import json_codec
+from utils.utils import iter_lines
 from reingestion_lambda.process_message import process_message
 from reingestion_lambda.Dataclasses import (
     EventMetadata,
@@ -13,10 +14,15 @@ def process_body(
 ):
     processed_body = ProcessedBody()
 
-    for line in object_body.split("\n"):
-        if len(line) == 0:
+    for line_number, line in enumerate(iter_lines(object_body, decode=False)):
+        # Lines before the checkpoint were sent by an earlier invocation.
+        if line_number < event_metadata.start_line:
             continue
 
+        if event_metadata.deadline_reached and event_metadata.deadline_reached():
+            processed_body.stopped_at_line = line_number
+            break
+
         message = get_message_from_line(line)
         processed_body = process_message(processed_body, message, event_metadata)
 
@@ -24,9 +30,7 @@ def process_body(
 
 
 def get_message_from_line(line):
-    batch = json.loads(line)
-    base64_message = batch["rawData"]
-    base64_bytes = base64_message.encode()
-    message_bytes = base64.b64decode(base64_bytes)
-    message = message_bytes.decode()
-    return message
+    # The message is kept as bytes, it is only decoded when each of its lines
+    # is parsed as JSON.
+    batch = json_codec.loads(line)
+    return binascii.a2b_base64(batch["rawData"])
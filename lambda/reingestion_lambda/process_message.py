@@ -1,56 +1,50 @@
-import json
 import gzip
 from reingestion_lambda.Dataclasses import (
     EventMetadata,
     ProcessedBody,
 )
-from utils.utils import put_records_to_firehose_stream
+from utils import json_codec
+from utils.firehose_batch_writer import FirehoseBatchWriter
 from reingestion_lambda.process_message_line import process_message_line
-
-
-MAX_BATCH_SIZE = 400
-FIREHOSE_MAX_ATTEMPTS = 20
+from utils.utils import iter_lines
 
 
 def process_message(
     processed_body: ProcessedBody, message, event_metadata: EventMetadata
 ):
-    for message_line in message.split("\n"):
-        if len(message_line) == 0:
-            continue
-
+    for message_line in iter_lines(message, decode=False):
         processed_message_line = process_message_line(
             message_line, processed_body.s3_payload, event_metadata
         )
         processed_body.reingest_json = processed_message_line.reingest_json
-        processed_body.s3_payload = processed_message_line.s3_payload
-        processed_body.count_for_s3 = processed_message_line.count_for_s3
+        processed_body.count_for_s3 += processed_message_line.count_for_s3
         processed_body.sent_to_s3 = processed_message_line.sent_to_s3
 
+        # Lines bound for Firehose leave the payload empty, which would drop
+        # the events already packaged for S3.
+        if processed_message_line.sent_to_s3:
+            processed_body.s3_payload = processed_message_line.s3_payload
+
         if not processed_body.sent_to_s3:
-            processed_body = process_for_firehose(processed_body)
-
-        if processed_body.count_for_firehose >= MAX_BATCH_SIZE:
-            put_records_to_firehose_stream(
-                event_metadata.FIREHOSE_STREAM_NAME,
-                processed_body.record_batch,
-                event_metadata.firehose_client,
-                attempts_made=0,
-                max_attempts=FIREHOSE_MAX_ATTEMPTS,
+            processed_body = process_for_firehose(
+                processed_body, event_metadata.firehose_writer
             )
-            processed_body.count_for_firehose = 0
-            processed_body.record_batch = []
 
     return processed_body
 
 
-def process_for_firehose(processed_body: ProcessedBody):
-    message_line = json.dumps(processed_body.reingest_json)
-    message_bytes = gzip.compress(message_line.encode())
-    new_record_batch = [*processed_body.record_batch]
-    new_record_batch.append({"Data": message_bytes})
-
+def process_for_firehose(
+    processed_body: ProcessedBody, writer: FirehoseBatchWriter = None
+):
+    message_line = json_codec.dumpb(processed_body.reingest_json)
+    message_bytes = gzip.compress(message_line)
     processed_body.count_for_firehose += 1
-    processed_body.record_batch = new_record_batch
+
+    # Without a writer the record is kept on the body for the caller to send.
+    # It is appended in place, copying the batch for every line is quadratic.
+    if writer is not None:
+        writer.put({"Data": message_bytes})
+    else:
+        processed_body.record_batch.append({"Data": message_bytes})
 
     return processed_body
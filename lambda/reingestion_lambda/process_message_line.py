@@ -1,4 +1,3 @@
-import json
 from dataclasses import asdict
 from reingestion_lambda.Dataclasses import (
     EventMetadata,
@@ -6,12 +5,13 @@ from reingestion_lambda.Dataclasses import (
     FieldsToReingest,
     MessageMetadata,
 )
+from utils import json_codec
 
 
 def process_message_line(message_line, s3_payload, event_metadata: EventMetadata):
     processed_message_line = ProcessedMessageLine()
 
-    json_data = json.loads(message_line)
+    json_data = json_codec.loads(message_line)
 
     message_metadata = get_message_metadata(json_data, event_metadata.bucket_name)
     times_reingested = message_metadata.fields_to_reingest.reingest
@@ -21,7 +21,7 @@ def process_message_line(message_line, s3_payload, event_metadata: EventMetadata
         processed_message_line.count_for_s3 += 1
         processed_message_line.sent_to_s3 = True
         processed_message_line.s3_payload = package_for_s3(
-            s3_payload, origin_bucket_name, json_data
+            s3_payload, origin_bucket_name, json_data, event_metadata.s3_spool
         )
     else:
         processed_message_line.reingest_json = {
@@ -56,17 +56,23 @@ def get_message_metadata(json_data, bucket_name):
     return metadata
 
 
-def package_for_s3(s3_payload, bucket_name, json_data):
+def package_for_s3(s3_payload, bucket_name, json_data, s3_spool=None):
+    # With a spool the event is appended to the bucket's buffer, rebuilding
+    # the payload string for every event is quadratic.
+    if s3_spool is not None:
+        s3_spool.write(bucket_name, json_codec.dumpb(json_data["event"]) + b"\n")
+        return s3_payload
+
     new_payload = {**s3_payload}
 
     bucket_name_not_in_payload = s3_payload.get(bucket_name) == None
 
     if bucket_name_not_in_payload:
-        new_payload[bucket_name] = f"{json.dumps(json_data['event'])}\n"
+        new_payload[bucket_name] = f"{json_codec.dumps(json_data['event'])}\n"
     else:
         existing_payload = new_payload[bucket_name]
         new_payload[
             bucket_name
-        ] = f"{existing_payload}{json.dumps(json_data['event'])}\n"
+        ] = f"{existing_payload}{json_codec.dumps(json_data['event'])}\n"
 
     return new_payload
@@ -1,44 +1,163 @@
 import gzip
+import io
 import os
-from urllib.parse import unquote_plus
-import boto3
-from utils.utils import put_records_to_firehose_stream
+from functools import partial
+from utils import metrics, profiling
+from utils.cache import get_client, get_or_create
+from utils.s3_notifications import (
+    get_max_concurrent_objects,
+    get_s3_objects_from_event,
+    process_s3_objects,
+    raise_for_failed_objects,
+)
+from utils.utils import is_deadline_near
+from utils.firehose_batch_writer import (
+    FirehoseBatchWriter,
+    get_max_in_flight_batches,
+)
 from reingestion_lambda.Dataclasses import (
     EventMetadata,
     ProcessedBody,
 )
+from reingestion_lambda.checkpoint import (
+    Checkpoint,
+    get_checkpoint_margin_ms,
+    get_checkpoint_store,
+)
 from reingestion_lambda.process_body import process_body
+from reingestion_lambda.s3_spool import (
+    S3PayloadSpool,
+    get_s3_spool_settings,
+    get_transfer_config,
+)
 
 
-def lambda_handler(event, _context):
-    s3_client = boto3.client("s3")
-    bucket_name = event["Records"][0]["s3"]["bucket"]["name"]
-    key = unquote_plus(event["Records"][0]["s3"]["object"]["key"], encoding="utf-8")
+@profiling.profiled
+@metrics.invocation("reingestion_lambda")
+def lambda_handler(event, context):
+    s3_client = get_client("s3")
 
-    FIREHOSE_STREAM_NAME, REGION, MAX_INGEST = get_environment_variables()
-    firehose_client = boto3.client("firehose", region_name=REGION)
+    FIREHOSE_STREAM_NAME, REGION, MAX_INGEST = get_or_create(
+        "reingestion_environment_variables", get_environment_variables
+    )
+    firehose_client = get_client("firehose", REGION)
+    max_in_flight_batches = get_or_create(
+        "max_in_flight_batches", get_max_in_flight_batches
+    )
+
+    checkpoint_store = get_or_create("checkpoint_store", get_checkpoint_store)
+    deadline_reached = partial(
+        is_deadline_near,
+        context,
+        get_or_create("checkpoint_margin_ms", get_checkpoint_margin_ms),
+    )
 
+    reingest_object = partial(
+        reingest_s3_object,
+        s3_client,
+        firehose_client,
+        FIREHOSE_STREAM_NAME,
+        REGION,
+        MAX_INGEST,
+        max_in_flight_batches,
+        checkpoint_store,
+        deadline_reached,
+    )
+
+    max_concurrent_objects = get_or_create(
+        "max_concurrent_objects", get_max_concurrent_objects
+    )
+    results = process_s3_objects(
+        get_s3_objects_from_event(event), reingest_object, max_concurrent_objects
+    )
+    metrics.add_ratio("CompressionRatio", "DecompressedBytes", "InputBytes")
+    raise_for_failed_objects(results)
+
+
+def reingest_s3_object(
+    s3_client,
+    firehose_client,
+    firehose_stream_name,
+    region,
+    max_ingest,
+    max_in_flight_batches,
+    checkpoint_store,
+    deadline_reached,
+    bucket_name,
+    key,
+):
     event_metadata = EventMetadata(
-        FIREHOSE_STREAM_NAME, firehose_client, REGION, MAX_INGEST, bucket_name, key
+        firehose_stream_name, firehose_client, region, max_ingest, bucket_name, key
     )
 
     object_from_s3 = s3_client.get_object(Bucket=event_metadata.bucket_name, Key=key)
+    etag = object_from_s3.get("ETag")
+
+    # Without a checkpoint store the object is always processed in full, as
+    # stopping early would only make the retry start again from the beginning.
+    checkpoint = Checkpoint()
+    if checkpoint_store is not None:
+        checkpoint = checkpoint_store.get(bucket_name, key, etag)
+        event_metadata.start_line = checkpoint.line_offset
+        event_metadata.deadline_reached = deadline_reached
 
-    with gzip.GzipFile(fileobj=object_from_s3["Body"], mode="r") as f:
-        object_body = f.read().decode()
+    # A retry of an event with several objects skips those an earlier attempt
+    # finished, rather than sending their events again.
+    if checkpoint.done:
+        print(f"Skipping s3://{bucket_name}/{key}, it was already reingested")
+        metrics.add("ObjectsSkipped", 1)
+        object_from_s3["Body"].close()
+        return
 
-    processed_body = process_body(object_body, event_metadata)
+    metrics.add("Objects", 1)
+    metrics.add("InputBytes", object_from_s3.get("ContentLength", 0), metrics.BYTES)
 
-    if processed_body.count_for_firehose > 0:
-        put_records_to_firehose_stream(
-            event_metadata.FIREHOSE_STREAM_NAME,
-            processed_body.record_batch,
-            event_metadata.firehose_client,
-            0,
-            20,
+    if event_metadata.start_line > 0:
+        print(
+            f"Resuming s3://{bucket_name}/{key} from line {event_metadata.start_line}"
         )
-    if processed_body.count_for_s3 > 0:
-        put_records_to_s3(event_metadata, processed_body)
+
+    spool_max_size, compress_failed_events = get_or_create(
+        "s3_spool_settings", get_s3_spool_settings
+    )
+
+    with S3PayloadSpool(spool_max_size, compress_failed_events) as s3_spool:
+        event_metadata.s3_spool = s3_spool
+
+        with FirehoseBatchWriter(
+            firehose_stream_name, firehose_client, max_in_flight=max_in_flight_batches
+        ) as writer:
+            event_metadata.firehose_writer = writer
+
+            # The object is gunzipped and parsed as it is read from S3.
+            with metrics.timer("ProcessObjectTime"):
+                with gzip.GzipFile(fileobj=object_from_s3["Body"], mode="r") as f:
+                    processed_body = process_body(f, event_metadata)
+                    metrics.add("DecompressedBytes", f.tell(), metrics.BYTES)
+
+        # Each event is either sent back to Firehose or, once it has been
+        # reingested max_ingest times, written to S3.
+        metrics.add("EventsToFirehose", processed_body.count_for_firehose)
+        metrics.add("EventsToS3", processed_body.count_for_s3)
+
+        if processed_body.count_for_s3 > 0:
+            with metrics.timer("S3WriteTime"):
+                put_records_to_s3(event_metadata, processed_body)
+
+    if checkpoint_store is None:
+        return
+
+    # Everything before the stopping line has been accepted by Firehose or
+    # written to S3 at this point, so the retry can safely skip it.
+    if processed_body.stopped_at_line is not None:
+        metrics.add("ObjectsCheckpointed", 1)
+        checkpoint_store.put(bucket_name, key, etag, processed_body.stopped_at_line)
+        raise RuntimeError(
+            f"Stopped before the Lambda timeout at line {processed_body.stopped_at_line}, "
+            "the retry will resume from the checkpoint."
+        )
+
+    checkpoint_store.mark_done(bucket_name, key, etag)
 
 
 def get_environment_variables():
@@ -64,10 +183,33 @@ def put_records_to_s3(event_metadata: EventMetadata, processed_body: ProcessedBo
     )
     file_name = event_metadata.key
     s3_path = f"SplashbackRawFailed/{file_name}"
-    for bucket in processed_body.s3_payload:
-        print(f"writing to bucket:{bucket} with s3_key:{s3_path}")
+    # A resumed invocation writes its own object rather than replacing the
+    # one written for the lines before the checkpoint.
+    if event_metadata.start_line > 0:
+        s3_path = f"{s3_path}.{event_metadata.start_line}"
+    s3_client = get_client("s3")
+    transfer_config = get_or_create("transfer_config", get_transfer_config)
 
-        s3write = boto3.resource("s3")
-        s3write.Bucket(bucket).put_object(
-            Key=s3_path, Body=processed_body.s3_payload[bucket].encode()
+    if event_metadata.s3_spool is not None:
+        s3_payload = event_metadata.s3_spool.get_files()
+        if event_metadata.s3_spool.compress:
+            s3_path = f"{s3_path}.gz"
+    else:
+        s3_payload = {
+            bucket: io.BytesIO(payload.encode())
+            for bucket, payload in processed_body.s3_payload.items()
+        }
+
+    def upload_payload(bucket, key):
+        print(f"writing to bucket:{bucket} with s3_key:{key}")
+        s3_client.upload_fileobj(
+            s3_payload[bucket], bucket, key, Config=transfer_config
         )
+
+    # Each origin bucket gets its own object, so they are uploaded in parallel.
+    results = process_s3_objects(
+        [(bucket, s3_path) for bucket in s3_payload],
+        upload_payload,
+        len(s3_payload),
+    )
+    raise_for_failed_objects(results)
@@ -0,0 +1,98 @@
+import gzip
+import os
+from tempfile import SpooledTemporaryFile
+from boto3.s3.transfer import TransferConfig
+
+
+DEFAULT_SPOOL_MAX_SIZE = 8388608
+DEFAULT_MULTIPART_THRESHOLD = 8388608
+DEFAULT_UPLOAD_CONCURRENCY = 4
+
+
+def get_s3_spool_settings():
+    try:
+        spool_max_size = int(os.environ["spool_max_size"])
+    except Exception:
+        spool_max_size = DEFAULT_SPOOL_MAX_SIZE
+
+    compress_failed_events = (
+        os.environ.get("compress_failed_events", "false").lower() == "true"
+    )
+    return spool_max_size, compress_failed_events
+
+
+def get_transfer_config():
+    try:
+        multipart_threshold = int(os.environ["multipart_threshold"])
+    except Exception:
+        multipart_threshold = DEFAULT_MULTIPART_THRESHOLD
+    try:
+        upload_concurrency = int(os.environ["upload_concurrency"])
+    except Exception:
+        upload_concurrency = DEFAULT_UPLOAD_CONCURRENCY
+
+    # Payloads above the threshold are sent as a multipart upload with parts
+    # of the same size, and a failed multipart upload is aborted.
+    return TransferConfig(
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=multipart_threshold,
+        max_concurrency=max(upload_concurrency, 1),
+    )
+
+
+class SpoolWriter:
+    def __init__(self, max_size, compress):
+        # The buffer is kept in memory until it grows past max_size, then it
+        # is moved to a file in /tmp.
+        self.file = SpooledTemporaryFile(max_size=max_size)
+        self.stream = (
+            gzip.GzipFile(fileobj=self.file, mode="wb") if compress else self.file
+        )
+        self.line_count = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.line_count += 1
+
+    def get_file(self):
+        if self.stream is not self.file and not self.stream.closed:
+            # Closing the gzip stream writes its trailer but leaves the
+            # underlying file open.
+            self.stream.close()
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+
+class S3PayloadSpool:
+    def __init__(self, max_size=DEFAULT_SPOOL_MAX_SIZE, compress=False):
+        self.max_size = max_size
+        self.compress = compress
+        self.writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def write(self, bucket_name, data):
+        writer = self.writers.get(bucket_name)
+        if writer is None:
+            writer = SpoolWriter(self.max_size, self.compress)
+            self.writers[bucket_name] = writer
+        writer.write(data)
+
+    def get_files(self):
+        return {
+            bucket_name: writer.get_file()
+            for bucket_name, writer in self.writers.items()
+        }
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
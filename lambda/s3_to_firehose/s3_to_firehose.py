@@ -1,34 +1,182 @@
-import json
+import gzip
 import os
-import urllib.parse
-import boto3
+from functools import partial
+from utils import json_codec, metrics, profiling
+from utils.cache import get_client, get_or_create
+from utils.constants import FIREHOSE_MAX_RECORD_SIZE
+from utils.s3_notifications import (
+    get_max_concurrent_objects,
+    get_s3_objects_from_event,
+    process_s3_objects,
+    raise_for_failed_objects,
+)
+from utils.firehose_batch_writer import FirehoseBatchWriter
+from utils.utils import split_lines_into_chunks
 
 
-def get_bucket_name_and_key(event):
-    bucket_name = event["Records"][0]["s3"]["bucket"]["name"]
-    object_key = urllib.parse.unquote_plus(
-        event["Records"][0]["s3"]["object"]["key"], encoding="utf-8"
+GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+# Without the .gz suffix the object does not trigger this Lambda again.
+OVERSIZED_LINES_KEY = "SplashbackRawFailed/{object_key}.oversized"
+
+
+def get_record_target_size():
+    try:
+        record_target_size = int(os.environ["record_target_size"])
+    except Exception:
+        record_target_size = 0
+    return min(record_target_size, FIREHOSE_MAX_RECORD_SIZE)
+
+
+def split_chunk_in_two(chunk):
+    # Cut after the newline closest to the middle, a single line has no cut.
+    middle = len(chunk) // 2
+    end = chunk.rfind(b"\n", 0, middle)
+    if end == -1:
+        end = chunk.find(b"\n", middle, len(chunk) - 1)
+    if end == -1:
+        return None
+    return chunk[: end + 1], chunk[end + 1 :]
+
+
+def create_records_from_chunk(chunk, object_is_zipped, oversized_lines):
+    data = gzip.compress(chunk) if object_is_zipped else chunk
+    if len(data) <= FIREHOSE_MAX_RECORD_SIZE:
+        yield {"Data": data}
+        return
+
+    halves = split_chunk_in_two(chunk)
+    if halves is None:
+        # Firehose rejects the record and a line cannot be split, so it is set
+        # aside rather than failing the whole object.
+        oversized_lines.append(chunk)
+        return
+
+    for half in halves:
+        yield from create_records_from_chunk(half, object_is_zipped, oversized_lines)
+
+
+def create_records_from_object(object_contents, target_size, oversized_lines):
+    object_is_zipped = object_contents[:2] == GZIP_MAGIC_NUMBER
+    chunk_target_size = target_size
+
+    if object_is_zipped:
+        compressed_size = len(object_contents)
+        object_contents = gzip.decompress(object_contents)
+        metrics.add("DecompressedBytes", len(object_contents), metrics.BYTES)
+        # Chunks are cut from the decompressed contents, so the target is
+        # scaled by the object's compression ratio to size the gzipped records.
+        chunk_target_size = int(target_size * len(object_contents) / compressed_size)
+
+    for chunk in split_lines_into_chunks(object_contents, chunk_target_size):
+        yield from create_records_from_chunk(chunk, object_is_zipped, oversized_lines)
+
+
+def put_object_in_chunks(
+    firehose_client, stream_name, object_contents, record_target_size, oversized_lines
+):
+    records = create_records_from_object(
+        object_contents, record_target_size, oversized_lines
     )
-    return bucket_name, object_key
 
+    with FirehoseBatchWriter(stream_name, firehose_client) as writer:
+        writer.put_records(records)
+
+    return {
+        "RecordsSent": writer.result.records_sent,
+        "BatchesSent": writer.result.batches_sent,
+    }
 
-def lambda_handler(event, _context):
-    s3_client = boto3.client("s3", region_name="eu-west-2")
-    firehose_client = boto3.client("firehose", region_name="eu-west-2")
 
+def put_oversized_lines_to_s3(s3_client, bucket_name, object_key, oversized_lines):
+    oversized_lines_key = OVERSIZED_LINES_KEY.format(object_key=object_key)
+    print(
+        f"{len(oversized_lines)} lines of s3://{bucket_name}/{object_key} are larger "
+        f"than a Firehose record, writing them to {oversized_lines_key}"
+    )
+    metrics.add("OversizedLines", len(oversized_lines))
+    s3_client.put_object(
+        Bucket=bucket_name, Key=oversized_lines_key, Body=b"".join(oversized_lines)
+    )
+
+
+def send_object_to_firehose(
+    s3_client,
+    firehose_client,
+    stream_name,
+    record_target_size,
+    bucket_name,
+    object_key,
+):
+    object_to_send = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+    object_contents = object_to_send["Body"].read()
+    metrics.add("Objects", 1)
+    metrics.add("InputBytes", len(object_contents), metrics.BYTES)
+
+    if record_target_size > 0:
+        oversized_lines = []
+        response = put_object_in_chunks(
+            firehose_client,
+            stream_name,
+            object_contents,
+            record_target_size,
+            oversized_lines,
+        )
+        if oversized_lines:
+            put_oversized_lines_to_s3(
+                s3_client, bucket_name, object_key, oversized_lines
+            )
+            response["OversizedLines"] = len(oversized_lines)
+        return response
+
+    with metrics.timer("FirehosePutTime"):
+        response = firehose_client.put_record(
+            DeliveryStreamName=stream_name,
+            Record={"Data": object_contents},
+        )
+    metrics.add("FirehoseRecordsSent", 1)
+
+    return json_codec.loads(json_codec.dumps(response, default=str))
+
+
+def get_environment_variables():
     try:
         FIREHOSE_STREAM_NAME = os.environ["Firehose"]
     except Exception:
         raise KeyError("Firehose environment variable not set.")
+    return FIREHOSE_STREAM_NAME, get_record_target_size(), get_max_concurrent_objects()
 
-    bucket_name, object_key = get_bucket_name_and_key(event)
 
-    object_to_send = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-    object_contents = object_to_send["Body"].read()
+@profiling.profiled
+@metrics.invocation("s3_to_firehose")
+def lambda_handler(event, _context):
+    s3_client = get_client("s3", "eu-west-2")
+    firehose_client = get_client("firehose", "eu-west-2")
+
+    FIREHOSE_STREAM_NAME, RECORD_TARGET_SIZE, MAX_CONCURRENT_OBJECTS = get_or_create(
+        "s3_to_firehose_environment_variables", get_environment_variables
+    )
+
+    send_object = partial(
+        send_object_to_firehose,
+        s3_client,
+        firehose_client,
+        FIREHOSE_STREAM_NAME,
+        RECORD_TARGET_SIZE,
+    )
 
-    response = firehose_client.put_record(
-        DeliveryStreamName=FIREHOSE_STREAM_NAME,
-        Record={"Data": object_contents},
+    results = process_s3_objects(
+        get_s3_objects_from_event(event), send_object, MAX_CONCURRENT_OBJECTS
     )
+    metrics.add_ratio("CompressionRatio", "DecompressedBytes", "InputBytes")
+    raise_for_failed_objects(results)
 
-    return json.loads(json.dumps(response, default=str))
+    return {
+        "Results": [
+            {
+                "BucketName": result.bucket_name,
+                "Key": result.key,
+                "Response": result.response,
+            }
+            for result in results
+        ]
+    }
@@ -0,0 +1,11 @@
+from tests.benchmarks.generators import set_splunk_environment_variables
+
+set_splunk_environment_variables()
+
+
+def pytest_ignore_collect(collection_path, config):
+    # The benchmarks are slow, so they are left out of the normal test run and
+    # only collected with --benchmark-only, which needs pytest-benchmark.
+    if collection_path.name.startswith("test_"):
+        return not config.getoption("benchmark_only", default=False)
+    return None
@@ -0,0 +1,90 @@
+import base64
+import gzip
+import json
+import os
+import random
+
+SPLUNK_ENVIRONMENT_VARIABLES = {
+    "splunk_host": "GitHub_Enterprise",
+    "splunk_index": "github_engineering_audit",
+    "splunk_source": "GitHub_Audit_Log_Stream",
+    "splunk_sourcetype": "github:enterprise:audit",
+    "timestamp_key": "@timestamp",
+}
+
+
+def set_splunk_environment_variables():
+    for key, value in SPLUNK_ENVIRONMENT_VARIABLES.items():
+        os.environ.setdefault(key, value)
+
+
+def generate_event(event_id, event_size=200):
+    event = {
+        "@timestamp": 1687853494341 + event_id,
+        "_document_id": f"id-{event_id}",
+        "action": "workflows.completed_workflow_run",
+        "actor": "actor",
+        "actor_id": 123456789,
+        "business": "test-business",
+        "data": "",
+    }
+    padding = max(event_size - len(json.dumps(event)), 0)
+    event["data"] = "x" * padding
+    return event
+
+
+def generate_firehose_record(record_id, event_count, event_size=200):
+    events = "".join(
+        f"{json.dumps(generate_event(event_id, event_size))}\n"
+        for event_id in range(event_count)
+    )
+    data = base64.b64encode(gzip.compress(events.encode())).decode()
+    return {"recordId": f"{record_id:060d}", "data": data}
+
+
+def generate_firehose_records(record_count, event_count, event_size=200):
+    return [
+        generate_firehose_record(record_id, event_count, event_size)
+        for record_id in range(record_count)
+    ]
+
+
+def generate_splashback_object(
+    line_count, events_per_line, max_ingest, event_size=200, seed=0
+):
+    # Reingest counts are drawn from a seeded generator, so roughly one event
+    # in max_ingest + 2 has been reingested too often and is routed to S3.
+    random_generator = random.Random(seed)
+    lines = []
+
+    for line_number in range(line_count):
+        first_event_id = line_number * events_per_line
+        events = [
+            generate_splashback_event(
+                event_id, random_generator.randint(0, max_ingest + 1), event_size
+            )
+            for event_id in range(first_event_id, first_event_id + events_per_line)
+        ]
+        message = "".join(f"{json.dumps(event)}\n" for event in events)
+        raw_data = base64.b64encode(message.encode()).decode()
+        lines.append(f"{json.dumps({'rawData': raw_data})}\n")
+
+    return gzip.compress("".join(lines).encode())
+
+
+def generate_splashback_event(event_id, reingest, event_size=200):
+    return {
+        "sourcetype": "github:enterprise:audit",
+        "source": "GitHub_Audit_Log_Stream",
+        "event": generate_event(event_id, event_size),
+        "fields": {"reingest": reingest, "origin_bucket_name": "origin-bucket"},
+    }
+
+
+def generate_s3_object(size, event_size=200, compress=True):
+    event_count = max(size // (event_size + 1), 1)
+    contents = "".join(
+        f"{json.dumps(generate_event(event_id, event_size))}\n"
+        for event_id in range(event_count)
+    ).encode()
+    return gzip.compress(contents) if compress else contents
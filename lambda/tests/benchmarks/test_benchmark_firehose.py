@@ -0,0 +1,42 @@
+import pytest
+from s3_to_firehose.s3_to_firehose import create_records_from_object
+from utils.utils import put_records_to_firehose_stream
+from tests.benchmarks.generators import generate_s3_object
+from tests.fake_firehose_client import FakeFirehoseClient
+from tests.mock_constants import MOCK_STREAM_NAME
+
+RECORD_TARGET_SIZE = 512000
+
+
+def no_sleep(_delay):
+    pass
+
+
+@pytest.mark.parametrize(
+    "partially_failed_calls", [0, 5], ids=["no_failures", "partial_failures"]
+)
+def test_put_records_to_firehose_stream(benchmark, partially_failed_calls):
+    records = [{"Data": b"x" * 1000} for _ in range(5000)]
+
+    def put_records():
+        client = FakeFirehoseClient(partially_failed_calls=partially_failed_calls)
+        return put_records_to_firehose_stream(
+            MOCK_STREAM_NAME, records, client, sleep=no_sleep
+        )
+
+    result = benchmark(put_records)
+
+    assert result.records_sent == len(records)
+
+
+@pytest.mark.parametrize("object_size", [1048576, 16777216], ids=["1MiB", "16MiB"])
+def test_create_records_from_object(benchmark, object_size):
+    object_contents = generate_s3_object(object_size)
+
+    records = benchmark(
+        lambda: list(
+            create_records_from_object(object_contents, RECORD_TARGET_SIZE, [])
+        )
+    )
+
+    assert len(records) >= len(object_contents) // RECORD_TARGET_SIZE
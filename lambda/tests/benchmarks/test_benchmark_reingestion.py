@@ -0,0 +1,47 @@
+import gzip
+import io
+import pytest
+from reingestion_lambda.Dataclasses import EventMetadata
+from reingestion_lambda.process_body import process_body
+from reingestion_lambda.s3_spool import S3PayloadSpool
+from utils.firehose_batch_writer import FirehoseBatchWriter
+from tests.benchmarks.generators import generate_splashback_object
+from tests.fake_firehose_client import FakeFirehoseClient
+from tests.mock_constants import MOCK_BUCKET_NAME, MOCK_STREAM_NAME
+
+MAX_INGEST = 3
+
+
+def reingest_object(object_contents):
+    client = FakeFirehoseClient()
+    event_metadata = EventMetadata(
+        MOCK_STREAM_NAME, client, "eu-west-2", MAX_INGEST, MOCK_BUCKET_NAME, "key"
+    )
+
+    with S3PayloadSpool() as s3_spool:
+        event_metadata.s3_spool = s3_spool
+        with FirehoseBatchWriter(MOCK_STREAM_NAME, client) as writer:
+            event_metadata.firehose_writer = writer
+            with gzip.GzipFile(fileobj=io.BytesIO(object_contents), mode="r") as f:
+                return process_body(f, event_metadata)
+
+
+@pytest.mark.parametrize(
+    "line_count, events_per_line",
+    [(100, 10), (1000, 10), (50, 500)],
+    ids=["100x10", "1000x10", "50x500"],
+)
+def test_process_body(benchmark, line_count, events_per_line):
+    object_contents = generate_splashback_object(
+        line_count, events_per_line, MAX_INGEST
+    )
+    benchmark.extra_info["events"] = line_count * events_per_line
+
+    processed_body = benchmark(reingest_object, object_contents)
+
+    assert processed_body.count_for_firehose > 0
+    assert processed_body.count_for_s3 > 0
+    assert (
+        processed_body.count_for_firehose + processed_body.count_for_s3
+        == line_count * events_per_line
+    )
@@ -0,0 +1,73 @@
+import os
+import pytest
+from transformation_lambda.parallel import map_in_processes
+from transformation_lambda.reingest import (
+    create_batches_from_record,
+    get_records_to_reingest,
+)
+from transformation_lambda.transformation_lambda import process_records
+from tests.benchmarks.generators import generate_firehose_records
+
+
+@pytest.mark.parametrize(
+    "record_count, event_count, event_size",
+    [(1, 1000, 200), (10, 1000, 200), (10, 100, 5000)],
+    ids=["1x1000x200B", "10x1000x200B", "10x100x5000B"],
+)
+def test_process_records(benchmark, record_count, event_count, event_size):
+    records = generate_firehose_records(record_count, event_count, event_size)
+    benchmark.extra_info["events"] = record_count * event_count
+
+    processed_records = benchmark(process_records, records)
+
+    assert len(processed_records) == record_count
+
+
+@pytest.mark.parametrize("event_count", [100, 1000, 10000, 100000])
+def test_process_records__events_per_record(benchmark, event_count):
+    # The mean divided by event_count shows whether the cost per event stays
+    # flat as a single record grows.
+    records = generate_firehose_records(1, event_count)
+    benchmark.extra_info["events"] = event_count
+
+    processed_records = benchmark(process_records, records)
+
+    assert len(processed_records) == 1
+
+
+@pytest.mark.parametrize(
+    "process_count", sorted({1, 2, os.cpu_count() or 1}), ids=lambda count: f"{count}"
+)
+def test_process_records__in_processes(benchmark, process_count):
+    records = generate_firehose_records(16, 5000)
+    benchmark.extra_info["events"] = 16 * 5000
+
+    if process_count == 1:
+        processed_records = benchmark(process_records, records)
+    else:
+        processed_records = benchmark(
+            map_in_processes, process_records, records, process_count
+        )
+
+    assert processed_records == process_records(records)
+
+
+def test_get_records_to_reingest(benchmark):
+    # The transformed records are larger than the 6 MB response limit, so
+    # some of them are planned for reingestion.
+    processed_records = process_records(generate_firehose_records(20, 2000))
+
+    records_to_reingest, record_ids_to_delete = benchmark(
+        get_records_to_reingest, processed_records
+    )
+
+    assert records_to_reingest
+    assert record_ids_to_delete
+
+
+def test_create_batches_from_record(benchmark):
+    processed_record = process_records(generate_firehose_records(1, 20000))[0]
+
+    batches = benchmark(create_batches_from_record, {"Data": processed_record["data"]})
+
+    assert len(batches) > 1
@@ -0,0 +1,9 @@
+import pytest
+from utils import cache
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    cache.reset()
+    yield
+    cache.reset()
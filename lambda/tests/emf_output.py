@@ -0,0 +1,7 @@
+import json
+
+
+def get_emf_metrics(output):
+    emf_lines = [line for line in output.splitlines() if line.startswith('{"_aws"')]
+    assert len(emf_lines) == 1
+    return json.loads(emf_lines[0])
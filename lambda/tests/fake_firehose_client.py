@@ -0,0 +1,62 @@
+from botocore.exceptions import ClientError
+from utils.constants import (
+    FIREHOSE_MAX_BATCH_RECORDS,
+    FIREHOSE_MAX_BATCH_SIZE,
+    FIREHOSE_MAX_RECORD_SIZE,
+)
+
+
+class FakeFirehoseClient:
+    def __init__(
+        self, throttled_calls=0, partially_failed_calls=0, error_code=None, errors=()
+    ):
+        self.throttled_calls = throttled_calls
+        self.partially_failed_calls = partially_failed_calls
+        self.error_code = error_code or "ServiceUnavailableException"
+        self.errors = list(errors)
+        self.calls = []
+        self.delivered_records = []
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        self.calls.append(list(Records))
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        if len(Records) > FIREHOSE_MAX_BATCH_RECORDS:
+            raise ClientError(
+                {"Error": {"Code": "InvalidArgumentException"}}, "PutRecordBatch"
+            )
+        if any(len(record["Data"]) > FIREHOSE_MAX_RECORD_SIZE for record in Records):
+            raise ClientError(
+                {"Error": {"Code": "InvalidArgumentException"}}, "PutRecordBatch"
+            )
+        if sum(len(record["Data"]) for record in Records) > FIREHOSE_MAX_BATCH_SIZE:
+            raise ClientError(
+                {"Error": {"Code": "InvalidArgumentException"}}, "PutRecordBatch"
+            )
+
+        if self.throttled_calls > 0:
+            self.throttled_calls -= 1
+            raise ClientError({"Error": {"Code": self.error_code}}, "PutRecordBatch")
+
+        request_responses = []
+
+        # Every other record fails while partial failures are being injected.
+        for idx, record in enumerate(Records):
+            if self.partially_failed_calls > 0 and idx % 2 == 0:
+                request_responses.append({"ErrorCode": self.error_code})
+            else:
+                request_responses.append({"RecordId": f"guid{idx}"})
+                self.delivered_records.append(record)
+
+        if self.partially_failed_calls > 0:
+            self.partially_failed_calls -= 1
+
+        failed_put_count = len(
+            [response for response in request_responses if "ErrorCode" in response]
+        )
+        return {
+            "FailedPutCount": failed_put_count,
+            "RequestResponses": request_responses,
+        }
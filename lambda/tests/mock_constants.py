@@ -16,9 +16,13 @@ MOCK_EVENT_OBJECT = {
 
 MOCK_STREAM_NAME = "test_stream"
 MOCK_STREAM_ARN = f"arn:aws:kinesis:eu-west-2:123456789012:stream/{MOCK_STREAM_NAME}"
-MAX_BATCH_LENGTH_PATH = "transformation_lambda.reingest.MAX_BATCH_LENGTH"
+MAX_REINGEST_RECORD_SIZE_PATH = (
+    "transformation_lambda.reingest.MAX_REINGEST_RECORD_SIZE"
+)
 MAX_LAMBDA_RETURN_PATH = "transformation_lambda.reingest.MAX_LAMBDA_RETURN_SIZE"
-PUT_RECORDS_TO_FIREHOSE_PATH = "utils.utils.put_records_to_firehose_stream"
+PUT_RECORDS_TO_FIREHOSE_PATH = (
+    "utils.firehose_batch_writer.put_records_to_firehose_stream"
+)
 FILEPATH_FOR_TEST_FOLDER = os.path.dirname(os.path.realpath(__file__))
 MOCK_EVENT_NAME = "mock_event.json"
 EXPECTED_OUTPUT_FILE_NAME = "expected_response.json"
@@ -0,0 +1,11 @@
+class MockContext:
+    def __init__(self, remaining_time_in_millis, time_per_call=0):
+        self.remaining_time_in_millis = remaining_time_in_millis
+        self.time_per_call = time_per_call
+
+    def get_remaining_time_in_millis(self):
+        # Each call moves the clock on, so a test can make the deadline arrive
+        # after a known amount of work.
+        remaining_time_in_millis = self.remaining_time_in_millis
+        self.remaining_time_in_millis -= self.time_per_call
+        return remaining_time_in_millis
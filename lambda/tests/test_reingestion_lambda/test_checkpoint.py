@@ -0,0 +1,79 @@
+import time
+import boto3
+import pytest
+from moto import mock_dynamodb
+from reingestion_lambda.checkpoint import (
+    CHECKPOINT_TTL_SECONDS,
+    Checkpoint,
+    DynamoDBCheckpointStore,
+    SqliteCheckpointStore,
+    get_checkpoint_store,
+)
+
+from tests.mock_constants import MOCK_BUCKET_NAME, REGION
+
+
+def create_sqlite_checkpoint_store(tmp_path):
+    return SqliteCheckpointStore(str(tmp_path / "checkpoints.db"))
+
+
+def create_dynamodb_checkpoint_store(tmp_path):
+    dynamodb_client = boto3.client("dynamodb", region_name=REGION)
+    dynamodb_client.create_table(
+        TableName="checkpoints",
+        KeySchema=[{"AttributeName": "ObjectId", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "ObjectId", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return DynamoDBCheckpointStore("checkpoints", dynamodb_client)
+
+
+@pytest.fixture(
+    params=[create_sqlite_checkpoint_store, create_dynamodb_checkpoint_store]
+)
+def checkpoint_store(request, tmp_path):
+    with mock_dynamodb():
+        yield request.param(tmp_path)
+
+
+def test_checkpoint_store(checkpoint_store):
+    assert checkpoint_store.get(MOCK_BUCKET_NAME, "key", "etag") == Checkpoint()
+
+    checkpoint_store.put(MOCK_BUCKET_NAME, "key", "etag", 10)
+    checkpoint_store.put(MOCK_BUCKET_NAME, "key", "etag", 20)
+    assert checkpoint_store.get(MOCK_BUCKET_NAME, "key", "etag") == Checkpoint(20)
+    assert checkpoint_store.get(MOCK_BUCKET_NAME, "key", "other etag") == Checkpoint()
+
+    checkpoint_store.delete(MOCK_BUCKET_NAME, "key", "etag")
+    assert checkpoint_store.get(MOCK_BUCKET_NAME, "key", "etag") == Checkpoint()
+
+
+def test_checkpoint_store__marks_object_done(checkpoint_store):
+    checkpoint_store.put(MOCK_BUCKET_NAME, "key", "etag", 10)
+    checkpoint_store.mark_done(MOCK_BUCKET_NAME, "key", "etag")
+
+    assert checkpoint_store.get(MOCK_BUCKET_NAME, "key", "etag").done
+    assert not checkpoint_store.get(MOCK_BUCKET_NAME, "key", "other etag").done
+
+
+def test_checkpoint_store__ignores_expired_checkpoints(checkpoint_store, mocker):
+    checkpoint_store.mark_done(MOCK_BUCKET_NAME, "key", "etag")
+    mocker.patch(
+        "reingestion_lambda.checkpoint.time.time",
+        return_value=time.time() + CHECKPOINT_TTL_SECONDS + 1,
+    )
+
+    assert checkpoint_store.get(MOCK_BUCKET_NAME, "key", "etag") == Checkpoint()
+
+
+def test_get_checkpoint_store(monkeypatch, tmp_path):
+    monkeypatch.delenv("checkpoint_table", raising=False)
+    monkeypatch.delenv("checkpoint_path", raising=False)
+    assert get_checkpoint_store() is None
+
+    monkeypatch.setenv("checkpoint_path", str(tmp_path / "checkpoints.db"))
+    assert isinstance(get_checkpoint_store(), SqliteCheckpointStore)
+
+    monkeypatch.setenv("checkpoint_table", "checkpoints")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", REGION)
+    assert isinstance(get_checkpoint_store(), DynamoDBCheckpointStore)
@@ -1,10 +1,18 @@
 import json
 import base64
+import gzip
+import io
 from reingestion_lambda.process_body import (
     process_body,
     get_message_from_line,
 )
-from reingestion_lambda.Dataclasses import ProcessedBody
+from reingestion_lambda.Dataclasses import EventMetadata, ProcessedBody
+
+from tests.mock_constants import MOCK_BUCKET_NAME
+
+
+def create_event_metadata():
+    return EventMetadata("", {}, "", 10, MOCK_BUCKET_NAME, "")
 
 
 def test_process_body(mocker):
@@ -26,15 +34,77 @@ def test_process_body(mocker):
         return_value="success",
     )
 
-    actual_output = process_body(input_body, {})
+    actual_output = process_body(input_body, create_event_metadata())
 
     assert actual_output == "success"
 
 
+def test_process_body__streams_file_object(mocker):
+    mock_lines = [
+        json.dumps({"rawData": base64.b64encode(data.encode()).decode()})
+        for data in ["message 1", "message 2"]
+    ]
+    input_body = gzip.GzipFile(
+        fileobj=io.BytesIO(
+            gzip.compress(f"{mock_lines[0]}\n{mock_lines[1]}\n".encode())
+        )
+    )
+    mock_process_message = mocker.patch(
+        "reingestion_lambda.process_body.process_message",
+        side_effect=lambda processed_body, message, event_metadata: processed_body,
+    )
+    mock_read = mocker.spy(input_body, "read")
+
+    process_body(input_body, create_event_metadata())
+
+    actual_messages = [call.args[1] for call in mock_process_message.call_args_list]
+    assert actual_messages == [b"message 1", b"message 2"]
+    mock_read.assert_not_called()
+
+
+def test_process_body__starts_from_start_line(mocker):
+    mock_lines = [
+        json.dumps({"rawData": base64.b64encode(data.encode()).decode()})
+        for data in ["message 0", "message 1", "message 2"]
+    ]
+    input_body = "\n".join(mock_lines)
+    mock_process_message = mocker.patch(
+        "reingestion_lambda.process_body.process_message",
+        side_effect=lambda processed_body, message, event_metadata: processed_body,
+    )
+    event_metadata = create_event_metadata()
+    event_metadata.start_line = 1
+
+    actual_processed_body = process_body(input_body, event_metadata)
+
+    actual_messages = [call.args[1] for call in mock_process_message.call_args_list]
+    assert actual_messages == [b"message 1", b"message 2"]
+    assert actual_processed_body.stopped_at_line is None
+
+
+def test_process_body__stops_when_deadline_is_reached(mocker):
+    mock_lines = [
+        json.dumps({"rawData": base64.b64encode(data.encode()).decode()})
+        for data in ["message 0", "message 1", "message 2"]
+    ]
+    input_body = "\n".join(mock_lines)
+    mock_process_message = mocker.patch(
+        "reingestion_lambda.process_body.process_message",
+        side_effect=lambda processed_body, message, event_metadata: processed_body,
+    )
+    event_metadata = create_event_metadata()
+    event_metadata.deadline_reached = lambda: mock_process_message.call_count >= 2
+
+    actual_processed_body = process_body(input_body, event_metadata)
+
+    assert mock_process_message.call_count == 2
+    assert actual_processed_body.stopped_at_line == 2
+
+
 def test_process_body__empty_body():
     input_body = ""
 
-    actual_processed = process_body(input_body, {})
+    actual_processed = process_body(input_body, create_event_metadata())
     expected_processed_body = ProcessedBody()
 
     assert actual_processed == expected_processed_body
@@ -46,6 +116,15 @@ def test_get_message_from_line():
     mock_event = {"rawData": base64.b64encode(mock_data_encoded).decode()}
     input_line = json.dumps(mock_event)
 
-    expected_message = mock_data
+    expected_message = mock_data_encoded
     actual_message = get_message_from_line(input_line)
     assert actual_message == expected_message
+
+
+def test_get_message_from_line__from_bytes():
+    mock_data_encoded = b"some data to be encoded"
+    input_line = json.dumps(
+        {"rawData": base64.b64encode(mock_data_encoded).decode()}
+    ).encode()
+
+    assert get_message_from_line(input_line) == mock_data_encoded
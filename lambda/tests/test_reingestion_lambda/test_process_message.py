@@ -8,6 +8,9 @@ from reingestion_lambda.Dataclasses import (
     EventMetadata,
     ProcessedBody,
 )
+from utils.firehose_batch_writer import FirehoseBatchWriter
+
+from tests.fake_firehose_client import FakeFirehoseClient
 
 from tests.mock_constants import (
     MOCK_BUCKET_NAME,
@@ -71,14 +74,14 @@ def test_process_message__processes_each_line():
     assert actual_processed_body.record_batch == expected_record_batch
 
 
-def test_process_message__processes_for_firehose(mocker):
-    mocker.patch("reingestion_lambda.process_message.MAX_BATCH_SIZE", 1)
-    mock_put_to_stream = mocker.patch(
-        "reingestion_lambda.process_message.put_records_to_firehose_stream"
-    )
+def test_process_message__processes_for_firehose():
+    firehose_client = FakeFirehoseClient()
+    writer = FirehoseBatchWriter("", firehose_client, max_batch_records=1)
 
     input_processed_body = ProcessedBody()
-    input_event_metadata = EventMetadata("", {}, "", 10, MOCK_BUCKET_NAME, "")
+    input_event_metadata = EventMetadata(
+        "", firehose_client, "", 10, MOCK_BUCKET_NAME, "", writer
+    )
 
     mock_message_line1 = json.dumps(
         {
@@ -102,9 +105,10 @@ def test_process_message__processes_for_firehose(mocker):
         input_processed_body, mock_message, input_event_metadata
     )
 
-    mock_put_to_stream.assert_called()
+    assert len(firehose_client.calls) == 2
+    assert writer.result.records_sent == 2
     assert actual_processed_body.count_for_s3 == 0
-    assert actual_processed_body.count_for_firehose == 0
+    assert actual_processed_body.count_for_firehose == 2
     assert actual_processed_body.s3_payload == {}
     assert actual_processed_body.record_batch == []
 
@@ -132,3 +136,78 @@ def test_process_for_firehose():
     actual_processed_body = process_for_firehose(mock_processed_body)
     assert actual_processed_body.record_batch == expected_record_batch
     assert actual_processed_body.count_for_firehose == expected_object_count
+
+
+def test_process_for_firehose__puts_record_to_writer():
+    firehose_client = FakeFirehoseClient()
+    mock_processed_body = ProcessedBody()
+    mock_processed_body.reingest_json = {"event": {"key": "value"}}
+
+    with FirehoseBatchWriter("", firehose_client) as writer:
+        actual_processed_body = process_for_firehose(mock_processed_body, writer)
+        assert firehose_client.calls == []
+
+    assert actual_processed_body.record_batch == []
+    assert actual_processed_body.count_for_firehose == 1
+    assert firehose_client.delivered_records == [
+        {"Data": gzip.compress(json.dumps({"event": {"key": "value"}}).encode())}
+    ]
+
+
+def test_process_for_firehose__appends_to_existing_batch():
+    mock_processed_body = ProcessedBody()
+    mock_record_batch = mock_processed_body.record_batch
+    mock_processed_body.reingest_json = {"event": {"key": "value"}}
+
+    for _ in range(3):
+        mock_processed_body = process_for_firehose(mock_processed_body)
+
+    assert mock_processed_body.record_batch is mock_record_batch
+    assert len(mock_record_batch) == 3
+    assert mock_processed_body.count_for_firehose == 3
+
+
+def test_process_message__counts_every_line_for_s3():
+    input_processed_body = ProcessedBody()
+    input_event_metadata = EventMetadata("", {}, "", 1, MOCK_BUCKET_NAME, "")
+
+    mock_message_line_for_s3 = json.dumps(
+        {
+            "event": {"key": "value1"},
+            "fields": {"origin_bucket_name": MOCK_BUCKET_NAME, "reingest": 1},
+        }
+    )
+    mock_message_line_for_firehose = json.dumps({"event": {"key": "value2"}})
+    mock_message = (
+        f"{mock_message_line_for_s3}\n{mock_message_line_for_s3}\n"
+        f"{mock_message_line_for_firehose}\n"
+    )
+
+    actual_processed_body = process_message(
+        input_processed_body, mock_message, input_event_metadata
+    )
+
+    assert actual_processed_body.count_for_s3 == 2
+    assert actual_processed_body.count_for_firehose == 1
+    assert actual_processed_body.s3_payload == {
+        MOCK_BUCKET_NAME: f'{json.dumps({"key": "value1"})}\n' * 2
+    }
+
+
+def test_process_message__processes_bytes():
+    input_event_metadata = EventMetadata("", {}, "", 10, MOCK_BUCKET_NAME, "")
+    mock_message = (
+        json.dumps({"event": {"key": "value1"}}).encode()
+        + b"\n"
+        + json.dumps({"event": {"key": "value2"}}).encode()
+    )
+
+    actual_processed_body = process_message(
+        ProcessedBody(), mock_message, input_event_metadata
+    )
+
+    actual_events = [
+        json.loads(gzip.decompress(record["Data"]))["event"]
+        for record in actual_processed_body.record_batch
+    ]
+    assert actual_events == [{"key": "value1"}, {"key": "value2"}]
@@ -6,6 +6,7 @@ from reingestion_lambda.process_message_line import (
     process_message_line,
 )
 from reingestion_lambda.Dataclasses import EventMetadata
+from reingestion_lambda.s3_spool import S3PayloadSpool
 from tests.mock_constants import (
     MOCK_BUCKET_NAME,
     MOCK_SOURCE,
@@ -163,3 +164,17 @@ def test_package_for_s3__payload_with_different_bucket():
         mock_s3_payload, different_bucket_name, mock_data
     )
     assert actual_s3_payload == expected_s3_payload
+
+
+def test_package_for_s3__writes_to_spool():
+    mock_s3_payload = {}
+    mock_data = {"event": {"second": "data"}}
+
+    with S3PayloadSpool() as s3_spool:
+        actual_s3_payload = package_for_s3(
+            mock_s3_payload, MOCK_BUCKET_NAME, mock_data, s3_spool
+        )
+        actual_contents = s3_spool.get_files()[MOCK_BUCKET_NAME].read().decode()
+
+    assert actual_s3_payload == {}
+    assert actual_contents == f'{json.dumps({"second": "data"})}\n'
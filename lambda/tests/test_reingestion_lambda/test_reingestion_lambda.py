@@ -13,12 +13,18 @@ from reingestion_lambda.Dataclasses import (
     EventMetadata,
     ProcessedBody,
 )
+from reingestion_lambda.s3_spool import S3PayloadSpool
+from utils.cache import get_client
+from utils.utils import FirehosePutResult
 
 from tests.mock_constants import (
     MOCK_BUCKET_NAME,
     MOCK_STREAM_NAME,
+    PUT_RECORDS_TO_FIREHOSE_PATH,
     REGION,
 )
+from tests.emf_output import get_emf_metrics
+from tests.mock_context import MockContext
 
 
 def test_get_environment_variables(monkeypatch):
@@ -94,6 +100,30 @@ def test_put_records_to_s3():
     assert actual_s3_object["Body"].read().decode() == '{"key": "value"}'
 
 
+@mock_s3
+def test_put_records_to_s3__from_spool():
+    mock_s3_client = boto3.client("s3", region_name=REGION)
+    mock_s3_client.create_bucket(
+        Bucket=MOCK_BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    mock_key = "mock_file_key"
+
+    with S3PayloadSpool(compress=True) as s3_spool:
+        s3_spool.write(MOCK_BUCKET_NAME, b'{"key": "value"}\n')
+        input_event_metadata = EventMetadata(
+            "", {}, REGION, 10, MOCK_BUCKET_NAME, mock_key, s3_spool=s3_spool
+        )
+
+        put_records_to_s3(input_event_metadata, ProcessedBody())
+
+    actual_s3_object = mock_s3_client.get_object(
+        Key="SplashbackRawFailed/mock_file_key.gz", Bucket=MOCK_BUCKET_NAME
+    )
+
+    assert gzip.decompress(actual_s3_object["Body"].read()) == b'{"key": "value"}\n'
+
+
 @mock_s3
 @mock_firehose
 def test_lambda_handler(monkeypatch):
@@ -174,6 +204,91 @@ def test_lambda_handler(monkeypatch):
     assert actual_file_contents == expected_contents_in_s3
 
 
+@mock_s3
+def test_put_records_to_s3__uploads_large_payload_in_parts(monkeypatch):
+    # moto stores the aws-chunked framing botocore adds to streamed parts when
+    # it calculates checksums that the request does not require.
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    monkeypatch.setenv("multipart_threshold", str(5 * 1024 * 1024))
+    mock_s3_client = boto3.client("s3", region_name=REGION)
+    mock_s3_client.create_bucket(
+        Bucket=MOCK_BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    mock_line = b'{"key": "value"}\n'
+    line_count = 11 * 1024 * 1024 // len(mock_line)
+
+    with S3PayloadSpool(max_size=1024 * 1024) as s3_spool:
+        for _ in range(line_count):
+            s3_spool.write(MOCK_BUCKET_NAME, mock_line)
+        input_event_metadata = EventMetadata(
+            "", {}, REGION, 10, MOCK_BUCKET_NAME, "mock_file_key", s3_spool=s3_spool
+        )
+
+        put_records_to_s3(input_event_metadata, ProcessedBody())
+
+    actual_s3_object = mock_s3_client.get_object(
+        Key="SplashbackRawFailed/mock_file_key", Bucket=MOCK_BUCKET_NAME
+    )
+
+    assert actual_s3_object["ETag"].endswith('-3"')
+    assert actual_s3_object["Body"].read() == mock_line * line_count
+
+
+@mock_s3
+def test_put_records_to_s3__aborts_failed_multipart_upload(monkeypatch):
+    monkeypatch.setenv("multipart_threshold", str(5 * 1024 * 1024))
+    mock_s3_client = boto3.client("s3", region_name=REGION)
+    mock_s3_client.create_bucket(
+        Bucket=MOCK_BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+
+    def fail_upload_part(**kwargs):
+        raise RuntimeError("Upload part failed")
+
+    get_client("s3").meta.events.register("before-call.s3.UploadPart", fail_upload_part)
+
+    input_processed_body = ProcessedBody()
+    input_processed_body.s3_payload = {MOCK_BUCKET_NAME: "a" * 6 * 1024 * 1024}
+    input_event_metadata = EventMetadata(
+        "", {}, REGION, 10, MOCK_BUCKET_NAME, "mock_file_key"
+    )
+
+    with pytest.raises(RuntimeError):
+        put_records_to_s3(input_event_metadata, input_processed_body)
+
+    multipart_uploads = mock_s3_client.list_multipart_uploads(Bucket=MOCK_BUCKET_NAME)
+    assert multipart_uploads.get("Uploads", []) == []
+
+
+@mock_s3
+def test_put_records_to_s3__uploads_every_bucket():
+    mock_s3_client = boto3.client("s3", region_name=REGION)
+    bucket_names = [f"{MOCK_BUCKET_NAME}-{index}" for index in range(3)]
+    for bucket_name in bucket_names:
+        mock_s3_client.create_bucket(
+            Bucket=bucket_name,
+            CreateBucketConfiguration={"LocationConstraint": REGION},
+        )
+
+    input_processed_body = ProcessedBody()
+    input_processed_body.s3_payload = {
+        bucket_name: f"{bucket_name}\n" for bucket_name in bucket_names
+    }
+    input_event_metadata = EventMetadata(
+        "", {}, REGION, 10, MOCK_BUCKET_NAME, "mock_file_key"
+    )
+
+    put_records_to_s3(input_event_metadata, input_processed_body)
+
+    for bucket_name in bucket_names:
+        actual_s3_object = mock_s3_client.get_object(
+            Key="SplashbackRawFailed/mock_file_key", Bucket=bucket_name
+        )
+        assert actual_s3_object["Body"].read().decode() == f"{bucket_name}\n"
+
+
 @mock_s3
 @mock_firehose
 def test_lambda_handler__puts_to_s3(monkeypatch):
@@ -310,3 +425,247 @@ def test_lambda_handler__raises_error(monkeypatch):
 
     expected_error_value = "An error occurred (NoSuchKey) when calling the GetObject operation: The specified key does not exist."
     assert expected_error_value == str(error_content.value)
+
+
+@mock_s3
+@mock_firehose
+def test_lambda_handler__processes_every_object(monkeypatch, mocker):
+    s3_client = boto3.client("s3", region_name=REGION)
+    firehose_client = boto3.client("firehose", region_name=REGION)
+
+    s3_client.create_bucket(
+        Bucket=MOCK_BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    s3_client.create_bucket(
+        Bucket="test_firehose_delivery",
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    firehose_client.create_delivery_stream(
+        DeliveryStreamName=MOCK_STREAM_NAME,
+        S3DestinationConfiguration={
+            "RoleARN": "arn:aws:iam::*",
+            "BucketARN": "arn:aws:s3:::test_firehose_delivery",
+        },
+    )
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("Region", REGION)
+    monkeypatch.setenv("max_ingest", str(5))
+
+    mock_records = []
+    for index in range(3):
+        mock_data = json.dumps({"event": f"event {index}"}).encode()
+        mock_line = json.dumps({"rawData": base64.b64encode(mock_data).decode()})
+
+        s3_client.put_object(
+            Bucket=MOCK_BUCKET_NAME,
+            Key=f"test_file_{index}",
+            Body=gzip.compress(f"{mock_line}\n".encode()),
+        )
+        mock_records.append(
+            {
+                "s3": {
+                    "bucket": {"name": MOCK_BUCKET_NAME},
+                    "object": {"key": f"test_file_{index}"},
+                },
+            }
+        )
+
+    mock_put_records_to_firehose_stream = mocker.patch(
+        PUT_RECORDS_TO_FIREHOSE_PATH,
+        return_value=FirehosePutResult(),
+    )
+
+    lambda_handler({"Records": mock_records}, {})
+
+    actual_events = sorted(
+        json.loads(gzip.decompress(record["Data"]))["event"]
+        for call in mock_put_records_to_firehose_stream.call_args_list
+        for record in call.args[1]
+    )
+    assert actual_events == ["event 0", "event 1", "event 2"]
+
+
+@mock_s3
+def test_lambda_handler__prints_routing_metrics(monkeypatch, mocker, capsys):
+    s3_client = boto3.client("s3", region_name=REGION)
+    s3_client.create_bucket(
+        Bucket=MOCK_BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    max_ingest = 2
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("Region", REGION)
+    monkeypatch.setenv("max_ingest", str(max_ingest))
+    monkeypatch.setenv("metrics_enabled", "true")
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+
+    mock_lines = []
+    for index, reingest in enumerate([0, 1, max_ingest]):
+        mock_data = json.dumps(
+            {
+                "event": f"event {index}",
+                "fields": {
+                    "origin_bucket_name": MOCK_BUCKET_NAME,
+                    "reingest": reingest,
+                },
+            }
+        ).encode()
+        mock_lines.append(json.dumps({"rawData": base64.b64encode(mock_data).decode()}))
+    test_file_contents = "".join(f"{line}\n" for line in mock_lines).encode()
+    test_file_contents_zipped = gzip.compress(test_file_contents)
+    s3_client.put_object(
+        Bucket=MOCK_BUCKET_NAME, Key="test_file", Body=test_file_contents_zipped
+    )
+    mocker.patch(PUT_RECORDS_TO_FIREHOSE_PATH, return_value=FirehosePutResult())
+
+    lambda_handler(
+        {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": MOCK_BUCKET_NAME},
+                        "object": {"key": "test_file"},
+                    },
+                }
+            ]
+        },
+        {},
+    )
+
+    emf = get_emf_metrics(capsys.readouterr().out)
+    assert emf["FunctionName"] == "reingestion_lambda"
+    assert emf["Objects"] == 1
+    assert emf["EventsToFirehose"] == 2
+    assert emf["EventsToS3"] == 1
+    assert emf["InputBytes"] == len(test_file_contents_zipped)
+    assert emf["DecompressedBytes"] == len(test_file_contents)
+    assert emf["CompressionRatio"] == len(test_file_contents) / len(
+        test_file_contents_zipped
+    )
+    assert "ProcessObjectTime" in emf
+    assert "FirehosePutTime" in emf
+    assert "S3WriteTime" in emf
+
+
+@mock_s3
+@mock_firehose
+def test_lambda_handler__resumes_from_checkpoint(monkeypatch, mocker, tmp_path):
+    s3_client = boto3.client("s3", region_name=REGION)
+    s3_client.create_bucket(
+        Bucket=MOCK_BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("Region", REGION)
+    monkeypatch.setenv("max_ingest", str(5))
+    monkeypatch.setenv("checkpoint_path", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("checkpoint_margin_ms", "1000")
+
+    mock_lines = []
+    for index in range(5):
+        mock_data = json.dumps({"event": f"event {index}"}).encode()
+        mock_lines.append(json.dumps({"rawData": base64.b64encode(mock_data).decode()}))
+    s3_client.put_object(
+        Bucket=MOCK_BUCKET_NAME,
+        Key="test_file",
+        Body=gzip.compress("\n".join(mock_lines).encode()),
+    )
+    mock_event = {
+        "Records": [
+            {
+                "s3": {
+                    "bucket": {"name": MOCK_BUCKET_NAME},
+                    "object": {"key": "test_file"},
+                },
+            }
+        ]
+    }
+
+    sent_events = []
+
+    def put_records(stream_name, records, *args, **kwargs):
+        sent_events.extend(
+            json.loads(gzip.decompress(record["Data"]))["event"] for record in records
+        )
+        return FirehosePutResult(records_sent=len(records), batches_sent=1)
+
+    mocker.patch(PUT_RECORDS_TO_FIREHOSE_PATH, side_effect=put_records)
+
+    with pytest.raises(RuntimeError) as error_content:
+        lambda_handler(mock_event, MockContext(2500, time_per_call=1000))
+
+    assert "resume from the checkpoint" in str(error_content.value)
+    assert sent_events == ["event 0", "event 1"]
+
+    lambda_handler(mock_event, MockContext(60000))
+
+    assert sent_events == ["event 0", "event 1", "event 2", "event 3", "event 4"]
+
+
+@mock_s3
+@mock_firehose
+def test_lambda_handler__retry_skips_objects_already_reingested(
+    monkeypatch, mocker, tmp_path
+):
+    s3_client = boto3.client("s3", region_name=REGION)
+    s3_client.create_bucket(
+        Bucket=MOCK_BUCKET_NAME,
+        CreateBucketConfiguration={"LocationConstraint": REGION},
+    )
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("Region", REGION)
+    monkeypatch.setenv("max_ingest", str(5))
+    monkeypatch.setenv("max_concurrent_objects", "1")
+    monkeypatch.setenv("checkpoint_path", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("checkpoint_margin_ms", "1000")
+
+    for key, line_count in [("file_a", 1), ("file_b", 5)]:
+        mock_lines = []
+        for index in range(line_count):
+            mock_data = json.dumps({"event": f"{key} {index}"}).encode()
+            mock_lines.append(
+                json.dumps({"rawData": base64.b64encode(mock_data).decode()})
+            )
+        s3_client.put_object(
+            Bucket=MOCK_BUCKET_NAME,
+            Key=key,
+            Body=gzip.compress("\n".join(mock_lines).encode()),
+        )
+    mock_event = {
+        "Records": [
+            {
+                "s3": {
+                    "bucket": {"name": MOCK_BUCKET_NAME},
+                    "object": {"key": key},
+                },
+            }
+            for key in ["file_a", "file_b"]
+        ]
+    }
+
+    sent_events = []
+
+    def put_records(stream_name, records, *args, **kwargs):
+        sent_events.extend(
+            json.loads(gzip.decompress(record["Data"]))["event"] for record in records
+        )
+        return FirehosePutResult(records_sent=len(records), batches_sent=1)
+
+    mocker.patch(PUT_RECORDS_TO_FIREHOSE_PATH, side_effect=put_records)
+
+    with pytest.raises(RuntimeError):
+        lambda_handler(mock_event, MockContext(3500, time_per_call=1000))
+
+    assert sent_events == ["file_a 0", "file_b 0", "file_b 1"]
+
+    lambda_handler(mock_event, MockContext(60000))
+
+    assert sent_events == [
+        "file_a 0",
+        "file_b 0",
+        "file_b 1",
+        "file_b 2",
+        "file_b 3",
+        "file_b 4",
+    ]
@@ -0,0 +1,56 @@
+import gzip
+from reingestion_lambda.s3_spool import S3PayloadSpool, get_s3_spool_settings
+
+
+def test_s3_payload_spool__writes_per_bucket():
+    with S3PayloadSpool() as s3_spool:
+        s3_spool.write("bucket1", b"line 1\n")
+        s3_spool.write("bucket2", b"line 2\n")
+        s3_spool.write("bucket1", b"line 3\n")
+
+        actual_contents = {
+            bucket_name: file.read()
+            for bucket_name, file in s3_spool.get_files().items()
+        }
+
+    assert actual_contents == {
+        "bucket1": b"line 1\nline 3\n",
+        "bucket2": b"line 2\n",
+    }
+
+
+def test_s3_payload_spool__spills_to_disk_above_max_size():
+    with S3PayloadSpool(max_size=10) as s3_spool:
+        s3_spool.write("bucket1", b"short\n")
+        assert not s3_spool.writers["bucket1"].file._rolled
+
+        s3_spool.write("bucket1", b"long enough to spill\n")
+        assert s3_spool.writers["bucket1"].file._rolled
+
+        assert s3_spool.get_files()["bucket1"].read() == (
+            b"short\nlong enough to spill\n"
+        )
+
+
+def test_s3_payload_spool__compresses():
+    with S3PayloadSpool(compress=True) as s3_spool:
+        s3_spool.write("bucket1", b"line 1\n")
+        s3_spool.write("bucket1", b"line 2\n")
+
+        actual_contents = gzip.decompress(s3_spool.get_files()["bucket1"].read())
+
+    assert actual_contents == b"line 1\nline 2\n"
+
+
+def test_get_s3_spool_settings(monkeypatch):
+    monkeypatch.setenv("spool_max_size", "1024")
+    monkeypatch.setenv("compress_failed_events", "true")
+
+    assert get_s3_spool_settings() == (1024, True)
+
+
+def test_get_s3_spool_settings__defaults(monkeypatch):
+    monkeypatch.delenv("spool_max_size", raising=False)
+    monkeypatch.delenv("compress_failed_events", raising=False)
+
+    assert get_s3_spool_settings() == (8388608, False)
@@ -1,8 +1,14 @@
+import gzip
 import os
 import boto3
 import pytest
 from moto import mock_s3, mock_firehose
-from s3_to_firehose.s3_to_firehose import lambda_handler
+from s3_to_firehose.s3_to_firehose import (
+    lambda_handler,
+    create_records_from_object,
+)
+
+from tests.emf_output import get_emf_metrics
 
 
 BUCKET_NAME = "test_bucket"
@@ -50,7 +56,8 @@ def test_successful_get_object(aws_services, monkeypatch):
 
     test_notification = build_test_notification(BUCKET_NAME, TEST_FILE_NAME)
 
-    firehose_response = lambda_handler(test_notification, {})
+    handler_response = lambda_handler(test_notification, {})
+    firehose_response = handler_response["Results"][0]["Response"]
     assert firehose_response["ResponseMetadata"]["HTTPStatusCode"] == 200
 
     bucket_contents = s3_client.list_objects_v2(Bucket="test_firehose_delivery")[
@@ -71,6 +78,234 @@ def test_unsuccessful_request_raises_error(aws_services):
         lambda_handler(test_notification, {})
 
 
+def test_successful_get_object__in_chunks(aws_services, monkeypatch):
+    s3_client, _ = aws_services
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("record_target_size", "64")
+
+    test_file_contents = "".join(
+        f'{{"event_id": {event_id}, "data": "some test data"}}\n'
+        for event_id in range(20)
+    ).encode()
+
+    s3_client.put_object(
+        Bucket=f"{BUCKET_NAME}",
+        Key=f"{TEST_FILE_NAME}.gz",
+        Body=gzip.compress(test_file_contents),
+    )
+
+    test_notification = build_test_notification(BUCKET_NAME, f"{TEST_FILE_NAME}.gz")
+
+    handler_response = lambda_handler(test_notification, {})
+    firehose_response = handler_response["Results"][0]["Response"]
+    assert firehose_response == {"RecordsSent": 2, "BatchesSent": 1}
+
+    bucket_contents = s3_client.list_objects_v2(Bucket="test_firehose_delivery")[
+        "Contents"
+    ]
+    assert len(bucket_contents) == 1
+
+    key = bucket_contents[0]["Key"]
+    actual_file = s3_client.get_object(Bucket="test_firehose_delivery", Key=key)
+    actual_file_contents = gzip.decompress(actual_file["Body"].read())
+    assert actual_file_contents == test_file_contents
+
+
+def test_successful_get_object__prints_metrics(aws_services, monkeypatch, capsys):
+    s3_client, _ = aws_services
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("record_target_size", "64")
+    monkeypatch.setenv("metrics_enabled", "true")
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+
+    test_file_contents = "".join(
+        f'{{"event_id": {event_id}, "data": "some test data"}}\n'
+        for event_id in range(20)
+    ).encode()
+    test_file_contents_zipped = gzip.compress(test_file_contents)
+
+    s3_client.put_object(
+        Bucket=f"{BUCKET_NAME}",
+        Key=f"{TEST_FILE_NAME}.gz",
+        Body=test_file_contents_zipped,
+    )
+
+    lambda_handler(build_test_notification(BUCKET_NAME, f"{TEST_FILE_NAME}.gz"), {})
+
+    emf = get_emf_metrics(capsys.readouterr().out)
+    assert emf["FunctionName"] == "s3_to_firehose"
+    assert emf["Objects"] == 1
+    assert emf["InputBytes"] == len(test_file_contents_zipped)
+    assert emf["DecompressedBytes"] == len(test_file_contents)
+    assert emf["FirehoseRecordsSent"] == 2
+    assert emf["FirehoseBatchesSent"] == 1
+    assert "FirehosePutTime" in emf
+
+
+def test_successful_get_object__prints_profile(aws_services, monkeypatch, capsys):
+    s3_client, _ = aws_services
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("profile_sample_rate", "1")
+    monkeypatch.delenv("profile_output_dir", raising=False)
+
+    s3_client.put_object(Bucket=f"{BUCKET_NAME}", Key=TEST_FILE_NAME, Body="data")
+
+    lambda_handler(build_test_notification(BUCKET_NAME, TEST_FILE_NAME), {})
+
+    output = capsys.readouterr().out
+    assert "Profile of s3_to_firehose-" in output
+    assert "send_object_to_firehose" in output
+
+
+def test_every_object_in_notification_is_sent(aws_services, monkeypatch):
+    s3_client, _ = aws_services
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+
+    for index in range(3):
+        s3_client.put_object(
+            Bucket=f"{BUCKET_NAME}", Key=f"file{index}.txt", Body=f"data {index}"
+        )
+
+    test_notification = build_test_notification(BUCKET_NAME, "file0.txt")
+    test_notification["Records"] = [
+        build_test_notification(BUCKET_NAME, f"file{index}.txt")["Records"][0]
+        for index in range(3)
+    ]
+
+    handler_response = lambda_handler(test_notification, {})
+
+    assert [result["Key"] for result in handler_response["Results"]] == [
+        "file0.txt",
+        "file1.txt",
+        "file2.txt",
+    ]
+    for result in handler_response["Results"]:
+        assert result["Response"]["ResponseMetadata"]["HTTPStatusCode"] == 200
+
+
+def test_failed_object_does_not_stop_other_objects(aws_services, monkeypatch, capfd):
+    s3_client, _ = aws_services
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+
+    s3_client.put_object(Bucket=f"{BUCKET_NAME}", Key="good.txt", Body="good data")
+
+    test_notification = {
+        "Records": [
+            build_test_notification(BUCKET_NAME, "missing.txt")["Records"][0],
+            build_test_notification(BUCKET_NAME, "good.txt")["Records"][0],
+        ]
+    }
+
+    with pytest.raises(Exception):
+        lambda_handler(test_notification, {})
+    actual_log, _ = capfd.readouterr()
+
+    assert "Processed 1 of 2 objects" in actual_log
+    assert f"Failed to process s3://{BUCKET_NAME}/missing.txt" in actual_log
+
+    bucket_contents = s3_client.list_objects_v2(Bucket="test_firehose_delivery")[
+        "Contents"
+    ]
+    actual_file = s3_client.get_object(
+        Bucket="test_firehose_delivery", Key=bucket_contents[0]["Key"]
+    )
+    assert actual_file["Body"].read() == b"good data"
+
+
+def test_create_records_from_object__zipped():
+    contents = b"line 1\nline 2\n"
+
+    actual_records = list(create_records_from_object(gzip.compress(contents), 7, []))
+
+    assert [gzip.decompress(record["Data"]) for record in actual_records] == [
+        b"line 1\n",
+        b"line 2\n",
+    ]
+
+
+def test_create_records_from_object__not_zipped():
+    contents = b"line 1\nline 2\n"
+
+    actual_records = list(create_records_from_object(contents, 7, []))
+
+    assert actual_records == [{"Data": b"line 1\n"}, {"Data": b"line 2\n"}]
+
+
+def test_create_records_from_object__sizes_zipped_records_after_compression():
+    contents = "".join(
+        f'{{"event_id": {event_id}, "data": "some test data"}}\n'
+        for event_id in range(5000)
+    ).encode()
+
+    actual_records = list(create_records_from_object(gzip.compress(contents), 4096, []))
+
+    record_sizes = [len(record["Data"]) for record in actual_records[:-1]]
+    assert min(record_sizes) > 4096 / 2
+    assert max(record_sizes) < 4096 * 2
+    assert (
+        b"".join(gzip.decompress(record["Data"]) for record in actual_records)
+        == contents
+    )
+
+
+def test_create_records_from_object__sets_aside_oversized_lines(monkeypatch):
+    monkeypatch.setattr("s3_to_firehose.s3_to_firehose.FIREHOSE_MAX_RECORD_SIZE", 20)
+    long_line = b"x" * 20 + b"\n"
+    contents = b"line 1\n" + long_line + b"line 2\n"
+    oversized_lines = []
+
+    actual_records = list(create_records_from_object(contents, 20, oversized_lines))
+
+    assert actual_records == [{"Data": b"line 1\n"}, {"Data": b"line 2\n"}]
+    assert oversized_lines == [long_line]
+
+
+def test_create_records_from_object__splits_zipped_records_over_the_maximum(
+    monkeypatch,
+):
+    monkeypatch.setattr("s3_to_firehose.s3_to_firehose.FIREHOSE_MAX_RECORD_SIZE", 100)
+    contents = b"".join(os.urandom(30).hex().encode() + b"\n" for _ in range(10))
+    oversized_lines = []
+
+    actual_records = list(
+        create_records_from_object(gzip.compress(contents), 10000, oversized_lines)
+    )
+
+    assert all(len(record["Data"]) <= 100 for record in actual_records)
+    assert (
+        b"".join(gzip.decompress(record["Data"]) for record in actual_records)
+        == contents
+    )
+    assert oversized_lines == []
+
+
+def test_oversized_lines_are_written_to_s3(aws_services, monkeypatch):
+    s3_client, _ = aws_services
+    monkeypatch.setenv("Firehose", MOCK_STREAM_NAME)
+    monkeypatch.setenv("record_target_size", "64")
+    monkeypatch.setattr("s3_to_firehose.s3_to_firehose.FIREHOSE_MAX_RECORD_SIZE", 64)
+    long_line = f'{{"data": "{"x" * 100}"}}\n'.encode()
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=TEST_FILE_NAME,
+        Body=b'{"data": "short"}\n' + long_line,
+    )
+
+    handler_response = lambda_handler(
+        build_test_notification(BUCKET_NAME, TEST_FILE_NAME), {}
+    )
+
+    assert handler_response["Results"][0]["Response"] == {
+        "RecordsSent": 1,
+        "BatchesSent": 1,
+        "OversizedLines": 1,
+    }
+    oversized_lines_object = s3_client.get_object(
+        Bucket=BUCKET_NAME, Key=f"SplashbackRawFailed/{TEST_FILE_NAME}.oversized"
+    )
+    assert oversized_lines_object["Body"].read() == long_line
+
+
 def build_test_notification(bucket_name, test_file_name):
     return {
         "Records": [
@@ -0,0 +1,46 @@
+import pytest
+from transformation_lambda.parallel import (
+    get_parallel_processes,
+    map_in_processes,
+    split_into_chunks,
+)
+
+
+def double_all(items):
+    return [item * 2 for item in items]
+
+
+def fail_on_three(items):
+    if 3 in items:
+        raise ValueError("three is not allowed")
+    return items
+
+
+def test_get_parallel_processes(monkeypatch):
+    monkeypatch.setenv("parallel_processes", "4")
+    assert get_parallel_processes() == 4
+
+
+def test_get_parallel_processes__not_set(monkeypatch):
+    monkeypatch.delenv("parallel_processes", raising=False)
+    assert get_parallel_processes() == 0
+
+
+def test_split_into_chunks():
+    assert split_into_chunks([1, 2, 3, 4, 5], 3) == [[1, 2], [3, 4], [5]]
+
+
+def test_split_into_chunks__fewer_items_than_chunks():
+    assert split_into_chunks([1, 2], 4) == [[1], [2]]
+
+
+def test_map_in_processes__keeps_input_order():
+    items = list(range(25))
+    assert map_in_processes(double_all, items, 4) == double_all(items)
+
+
+def test_map_in_processes__raises_worker_errors():
+    with pytest.raises(RuntimeError) as error_content:
+        map_in_processes(fail_on_three, [1, 2, 3, 4], 2)
+
+    assert "three is not allowed" in str(error_content.value)
@@ -1,17 +1,24 @@
+import base64
 import gzip
 import json
 from tests.mock_constants import (
-    MAX_BATCH_LENGTH_PATH,
+    MAX_REINGEST_RECORD_SIZE_PATH,
     MAX_LAMBDA_RETURN_PATH,
     MOCK_EVENT_STRING,
 )
 from transformation_lambda.reingest import (
+    get_kept_record_size,
+    get_untransformed_records_to_reingest,
+    get_encoded_data_size,
+    get_records_to_reingest,
+    get_response_size,
     get_record_to_reingest,
     create_batches_from_record,
     format_record_for_firehose,
-    create_batch,
     delete_records_to_be_reingested,
 )
+from transformation_lambda.transformation_lambda import encode_record_data
+from utils import json_codec
 
 
 def test_get_record_to_reingest(mocker):
@@ -20,10 +27,6 @@ def test_get_record_to_reingest(mocker):
         MAX_LAMBDA_RETURN_PATH,
         5,
     )
-    mocker.patch(
-        MAX_BATCH_LENGTH_PATH,
-        10,
-    )
 
     mocker.patch(
         "transformation_lambda.reingest.create_batches_from_record",
@@ -45,87 +48,65 @@ def test_format_record_for_firehose():
     assert actual_record == expected_record
 
 
-def test_create_batch():
-    input_batch = [
-        {"event1": "event1_data"},
-        {"event2": "event2_data"},
-        {"event3": "event3_data"},
-        {"event4": "event4_data"},
-    ]
+def test_create_batches_from_record(mocker):
+    mocker.patch(
+        MAX_REINGEST_RECORD_SIZE_PATH,
+        52,
+    )
 
-    max_batch_amount = 2
+    input_data = """{"event1": "event1_data"}\n{"event2": "event2_data"}\n{"event3": "event3_data"}\n"""
+    input_records = {"Data": input_data}
 
-    expected_data = json.dumps(
-        [
-            {"event1": "event1_data"},
-            {"event2": "event2_data"},
-        ]
-    )
-    expected_zip = gzip.compress(expected_data.encode())
-    expected_output = {"Data": expected_zip}
+    batch_1 = """{"event1": "event1_data"}\n{"event2": "event2_data"}\n"""
+    batch_2 = """{"event3": "event3_data"}\n"""
 
-    actual_output = create_batch(input_batch, max_batch_amount)
+    actual_output = create_batches_from_record(input_records)
 
-    assert actual_output == expected_output
+    assert [gzip.decompress(batch["Data"]).decode() for batch in actual_output] == [
+        batch_1,
+        batch_2,
+    ]
 
 
-def test_create_batches_from_record(mocker):
+def test_create_batches_from_record__everything_fits_in_one_batch(mocker):
     mocker.patch(
-        MAX_BATCH_LENGTH_PATH,
-        2,
+        MAX_REINGEST_RECORD_SIZE_PATH,
+        78,
     )
 
     input_data = """{"event1": "event1_data"}\n{"event2": "event2_data"}\n{"event3": "event3_data"}\n"""
     input_records = {"Data": input_data}
 
-    batch_1 = json.dumps(
-        [
-            {"event1": "event1_data"},
-            {"event2": "event2_data"},
-        ]
-    )
-    batch_2 = json.dumps(
-        [
-            {"event3": "event3_data"},
-        ]
-    )
+    expected_output = [{"Data": gzip.compress(input_data.encode())}]
 
-    batch_1_zipped = gzip.compress(batch_1.encode())
-    batch_2_zipped = gzip.compress(batch_2.encode())
+    actual_output = create_batches_from_record(input_records)
+    assert actual_output == expected_output
 
-    batch_1_object = {"Data": batch_1_zipped}
-    batch_2_object = {"Data": batch_2_zipped}
 
-    expected_output = [batch_1_object, batch_2_object]
+def test_create_batches_from_record__does_not_parse_lines(mocker):
+    mock_loads = mocker.spy(json_codec, "loads")
+    input_records = {"Data": "not json\n{\n"}
 
     actual_output = create_batches_from_record(input_records)
 
-    assert actual_output == expected_output
+    assert gzip.decompress(actual_output[0]["Data"]) == b"not json\n{\n"
+    mock_loads.assert_not_called()
 
 
-def test_create_batches_from_record__with_exactly_max_batch_amount(mocker):
+def test_get_records_to_reingest__returns_flat_list_of_records(mocker):
+    processed_records = build_processed_records([10, 10])
+    mocker.patch(MAX_LAMBDA_RETURN_PATH, 0)
     mocker.patch(
-        MAX_BATCH_LENGTH_PATH,
-        3,
+        "transformation_lambda.reingest.create_batches_from_record",
+        side_effect=[[{"Data": b"1"}, {"Data": b"2"}], [{"Data": b"3"}]],
     )
 
-    input_data = """{"event1": "event1_data"}\n{"event2": "event2_data"}\n{"event3": "event3_data"}\n"""
-    input_records = {"Data": input_data}
-
-    expected_batch = json.dumps(
-        [
-            {"event1": "event1_data"},
-            {"event2": "event2_data"},
-            {"event3": "event3_data"},
-        ]
+    records_to_reingest, record_ids_to_delete = get_records_to_reingest(
+        processed_records
     )
-    expected_batch_zipped = gzip.compress(expected_batch.encode())
-    expected_batch_object = {"Data": expected_batch_zipped}
 
-    expected_output = [expected_batch_object]
-
-    actual_output = create_batches_from_record(input_records)
-    assert actual_output == expected_output
+    assert records_to_reingest == [{"Data": b"1"}, {"Data": b"2"}, {"Data": b"3"}]
+    assert record_ids_to_delete == ["guid0", "guid1"]
 
 
 def test_delete_records_to_be_reingested():
@@ -144,3 +125,129 @@ def test_delete_records_to_be_reingested():
     )
 
     assert actual_output == expected_output
+
+
+def build_processed_records(data_sizes):
+    return [
+        {"data": "x" * data_size, "result": "Ok", "recordId": f"guid{index}"}
+        for index, data_size in enumerate(data_sizes)
+    ]
+
+
+def test_get_encoded_data_size():
+    for data in ["", "a", "ab", "abc", "abcd", "café ☃"]:
+        expected_size = len(base64.b64encode(data.encode()))
+        assert get_encoded_data_size(data) == expected_size
+
+
+def test_get_response_size__matches_encoded_response():
+    processed_records = build_processed_records([0, 1, 10, 100])
+    processed_records[1]["data"] = "café ☃"
+    record_ids_to_delete = {"guid2"}
+
+    response_records = delete_records_to_be_reingested(
+        [dict(record) for record in processed_records], record_ids_to_delete
+    )
+    response = {"records": [encode_record_data(record) for record in response_records]}
+
+    actual_size = get_response_size(processed_records, record_ids_to_delete)
+
+    assert actual_size == len(json.dumps(response))
+
+
+def test_get_records_to_reingest__everything_fits(mocker):
+    processed_records = build_processed_records([100, 100])
+    mocker.patch(MAX_LAMBDA_RETURN_PATH, get_response_size(processed_records, set()))
+
+    records_to_reingest, record_ids_to_delete = get_records_to_reingest(
+        processed_records
+    )
+
+    assert records_to_reingest == []
+    assert record_ids_to_delete == []
+
+
+def test_get_records_to_reingest__uses_encoded_size(mocker):
+    processed_records = build_processed_records([300, 300])
+    mocker.patch(
+        MAX_LAMBDA_RETURN_PATH, get_response_size(processed_records, set()) - 1
+    )
+    mocker.patch(
+        "transformation_lambda.reingest.create_batches_from_record",
+        return_value=[],
+    )
+
+    _, record_ids_to_delete = get_records_to_reingest(processed_records)
+
+    assert len(record_ids_to_delete) == 1
+
+
+def test_get_records_to_reingest__keeps_as_much_data_as_possible(mocker):
+    processed_records = build_processed_records([30, 600, 30, 30])
+    max_return_size = get_response_size(processed_records, {"guid0", "guid2", "guid3"})
+    mocker.patch(MAX_LAMBDA_RETURN_PATH, max_return_size)
+    mocker.patch(
+        "transformation_lambda.reingest.create_batches_from_record",
+        return_value=[],
+    )
+
+    _, record_ids_to_delete = get_records_to_reingest(processed_records)
+
+    assert record_ids_to_delete == ["guid0", "guid2", "guid3"]
+
+
+def test_get_untransformed_records_to_reingest():
+    original_data = gzip.compress(b'{"event": "original"}\n')
+    records = [
+        {"recordId": "guid0", "data": base64.b64encode(b"transformed").decode()},
+        {"recordId": "guid1", "data": base64.b64encode(original_data).decode()},
+    ]
+    processed_records = [
+        {"data": "transformed", "result": "Ok", "recordId": "guid0"},
+        {"result": "Dropped", "recordId": "guid1"},
+    ]
+
+    actual_records = get_untransformed_records_to_reingest(records, processed_records)
+
+    assert actual_records == [{"Data": original_data}]
+
+
+def test_get_records_to_reingest__skips_untransformed_records(mocker):
+    processed_records = [
+        *build_processed_records([100]),
+        {"result": "Dropped", "recordId": "guid1"},
+    ]
+    mocker.patch(MAX_LAMBDA_RETURN_PATH, get_response_size(processed_records, set()))
+
+    records_to_reingest, record_ids_to_delete = get_records_to_reingest(
+        processed_records
+    )
+
+    assert records_to_reingest == []
+    assert record_ids_to_delete == []
+
+
+def test_get_records_to_reingest__keeps_failed_records(mocker):
+    processed_records = [
+        {"data": "x" * 100, "result": "ProcessingFailed", "recordId": "guid0"},
+        *build_processed_records([0, 100])[1:],
+    ]
+    mocker.patch(
+        MAX_LAMBDA_RETURN_PATH,
+        get_response_size(processed_records, {"guid1"}),
+    )
+
+    records_to_reingest, record_ids_to_delete = get_records_to_reingest(
+        processed_records
+    )
+
+    assert record_ids_to_delete == ["guid1"]
+
+
+def test_get_kept_record_size__failed_record_is_already_encoded():
+    failed_record = {"data": "x" * 100, "result": "ProcessingFailed", "recordId": "a"}
+
+    expected_size = len(
+        json.dumps({"data": "x" * 100, "recordId": "a", "result": "ProcessingFailed"})
+    )
+    assert get_kept_record_size(failed_record) == expected_size
@@ -3,15 +3,22 @@ import gzip
 import json
 import os
 import boto3
+import pytest
 from moto import mock_firehose, mock_s3
+from utils import json_codec
+from utils.utils import FirehosePutResult
 from transformation_lambda.transformation_lambda import (
     lambda_handler,
     process_event,
+    process_line,
     process_records,
     transform_log_event,
+    create_hec_envelope,
     get_region_from_arn,
     get_stream_name_from_arn,
     encode_record_data,
+    iter_record_lines,
+    get_invalid_line_mode,
 )
 
 
@@ -26,6 +33,8 @@ from tests.mock_constants import (
     MOCK_EVENT_NAME,
     EXPECTED_OUTPUT_FILE_NAME,
 )
+from tests.emf_output import get_emf_metrics
+from tests.mock_context import MockContext
 
 os.environ["splunk_host"] = "GitHub_Enterprise"
 os.environ["splunk_index"] = "github_engineering_audit"
@@ -50,6 +59,47 @@ def test_transform_log_event():
     assert actual_event == expected_event
 
 
+def test_transform_log_event__matches_serialising_whole_event():
+    expected_event = {
+        "host": "GitHub_Enterprise",
+        "index": "github_engineering_audit",
+        "source": "GitHub_Audit_Log_Stream",
+        "sourcetype": "github:enterprise:audit",
+        "time": 1234567890,
+        "event": {**MOCK_EVENT_OBJECT, "nested": {"list": [1, "two"]}},
+    }
+    actual_event = transform_log_event(expected_event["event"])
+
+    assert actual_event == f"{json.dumps(expected_event)}\n"
+
+
+def test_transform_log_event__compact_json(monkeypatch):
+    monkeypatch.setenv("compact_json", "true")
+    expected_event = {
+        "host": "GitHub_Enterprise",
+        "index": "github_engineering_audit",
+        "source": "GitHub_Audit_Log_Stream",
+        "sourcetype": "github:enterprise:audit",
+        "time": 1234567890,
+        "event": MOCK_EVENT_OBJECT,
+    }
+    actual_event = transform_log_event(MOCK_EVENT_OBJECT)
+
+    assert actual_event == f"{json.dumps(expected_event, separators=(',', ':'))}\n"
+
+
+def test_create_hec_envelope():
+    envelope = create_hec_envelope()
+
+    assert envelope.prefix == (
+        '{"host": "GitHub_Enterprise", "index": "github_engineering_audit", '
+        '"source": "GitHub_Audit_Log_Stream", "sourcetype": "github:enterprise:audit", '
+        '"time": '
+    )
+    assert envelope.event_key == ', "event": '
+    assert envelope.timestamp_key == "@timestamp"
+
+
 def test_encode_record_data():
     input_record = {"data": MOCK_EVENT_STRING, "recordId": "guid", "result": "Ok"}
     encoded_mock_event = base64.b64encode(MOCK_EVENT_STRING.encode()).decode()
@@ -75,11 +125,52 @@ def test_process_event__contains_sourcetype():
         "sourcetype": "some sourcetype",
         "event": MOCK_EVENT_OBJECT,
     }
-    expected_event = json.dumps(test_event)
+    expected_event = f"{json.dumps(test_event)}\n"
     actual_event = process_event(test_event)
     assert actual_event == expected_event
 
 
+def test_process_line():
+    expected_event = transform_log_event(MOCK_EVENT_OBJECT)
+    actual_event = process_line(MOCK_EVENT_STRING)
+    assert actual_event == expected_event
+
+
+def test_process_line__reingested_event_is_passed_through(mocker):
+    mock_loads = mocker.spy(json_codec, "loads")
+    test_line = json.dumps({"sourcetype": "some sourcetype", "event": "event"})
+
+    actual_event = process_line(test_line)
+
+    assert actual_event == f"{test_line}\n"
+    mock_loads.assert_not_called()
+
+
+def test_process_line__processed_event_is_passed_through(mocker):
+    mock_loads = mocker.spy(json_codec, "loads")
+    test_line = transform_log_event(MOCK_EVENT_OBJECT)[:-1]
+
+    actual_event = process_line(test_line)
+
+    assert actual_event == f"{test_line}\n"
+    mock_loads.assert_not_called()
+
+
+def test_process_line__nested_sourcetype_is_not_passed_through():
+    test_event = {"event": {"sourcetype": "some sourcetype"}, "@timestamp": 1}
+    expected_event = transform_log_event(test_event)
+
+    actual_event = process_line(json.dumps(test_event))
+
+    assert actual_event == expected_event
+
+
+def test_process_line__sourcetype_not_first_key():
+    test_event = {"event": MOCK_EVENT_OBJECT, "sourcetype": "some sourcetype"}
+    actual_event = process_line(json.dumps(test_event))
+    assert actual_event == f"{json.dumps(test_event)}\n"
+
+
 def setup_records_for_test(add_sourcetype):
     if add_sourcetype:
         test_event_1 = {
@@ -107,8 +198,8 @@ def setup_records_for_test(add_sourcetype):
 
     mock_data_1_zipped = gzip.compress(test_events_1.encode())
     mock_data_2_zipped = gzip.compress(test_events_2.encode())
-    mock_data_1_encoded = base64.b64encode(mock_data_1_zipped)
-    mock_data_2_encoded = base64.b64encode(mock_data_2_zipped)
+    mock_data_1_encoded = base64.b64encode(mock_data_1_zipped).decode()
+    mock_data_2_encoded = base64.b64encode(mock_data_2_zipped).decode()
 
     mock_record_1 = {"recordId": "guid1", "data": mock_data_1_encoded}
     mock_record_2 = {"recordId": "guid2", "data": mock_data_2_encoded}
@@ -116,7 +207,7 @@ def setup_records_for_test(add_sourcetype):
     input_records = [mock_record_1, mock_record_2]
 
     if add_sourcetype:
-        expected_data_1 = f"{json.dumps(test_event_1)}{json.dumps(test_event_2)}"
+        expected_data_1 = f"{json.dumps(test_event_1)}\n{json.dumps(test_event_2)}\n"
     else:
         expected_data_1 = (
             f"{transform_log_event(test_event_1)}{transform_log_event(test_event_2)}"
@@ -146,6 +237,22 @@ def test_process_records_with_some_already_processed():
     assert actual_output == expected_output
 
 
+def test_iter_record_lines():
+    test_data = 'first line\n\n{"second": "line"}\r\nlast line without newline'
+    test_record = {
+        "recordId": "guid1",
+        "data": base64.b64encode(gzip.compress(test_data.encode())).decode(),
+    }
+
+    actual_lines = list(iter_record_lines(test_record))
+
+    assert actual_lines == [
+        b"first line",
+        b'{"second": "line"}\r',
+        b"last line without newline",
+    ]
+
+
 def test_get_region_from_arn():
     actual_region = get_region_from_arn(MOCK_STREAM_ARN)
     expected_region = "eu-west-2"
@@ -218,7 +325,7 @@ def test_lambda_handler__successfully_deletes_records(mocker):
     )
     mocker.patch(
         PUT_RECORDS_TO_FIREHOSE_PATH,
-        return_value=None,
+        return_value=FirehosePutResult(),
     )
 
     actual_output = lambda_handler(test_event, {})
@@ -252,7 +359,7 @@ def test_lambda_handler__successfully_tries_to_reingest(mocker):
     )
     mock_put_records_to_firehose_stream = mocker.patch(
         PUT_RECORDS_TO_FIREHOSE_PATH,
-        return_value=None,
+        return_value=FirehosePutResult(),
     )
 
     actual_output = lambda_handler(test_event, {})
@@ -267,3 +374,331 @@ def generate_mock_data():
 
     mock_data = base64.b64encode(mock_data.encode()).decode()
     return mock_data
+
+
+def test_lambda_handler__parallel_processes(monkeypatch):
+    monkeypatch.setenv("parallel_processes", "2")
+    test_records, _ = setup_records_for_test(False)
+    test_event = {"deliveryStreamArn": MOCK_STREAM_ARN, "records": test_records}
+
+    expected_output = {
+        "records": [
+            encode_record_data(record) for record in process_records(test_records)
+        ]
+    }
+
+    actual_output = lambda_handler(test_event, {})
+
+    assert actual_output == expected_output
+
+
+def test_process_records__stops_at_deadline():
+    test_records, expected_records = setup_records_for_test(False)
+    deadline_checks = []
+
+    def deadline_reached():
+        deadline_checks.append(1)
+        return len(deadline_checks) > 1
+
+    actual_records = process_records(test_records, deadline_reached)
+
+    assert actual_records == [
+        expected_records[0],
+        {"result": "Dropped", "recordId": "guid2"},
+    ]
+
+
+def test_lambda_handler__reingests_untransformed_records_at_deadline(
+    mocker, monkeypatch
+):
+    monkeypatch.setenv("deadline_margin_ms", "1000")
+    test_records, expected_records = setup_records_for_test(False)
+    test_event = {"deliveryStreamArn": MOCK_STREAM_ARN, "records": test_records}
+    mock_put_records_to_firehose_stream = mocker.patch(
+        PUT_RECORDS_TO_FIREHOSE_PATH,
+        return_value=FirehosePutResult(),
+    )
+
+    actual_output = lambda_handler(test_event, MockContext(1500, time_per_call=1000))
+
+    assert actual_output == {
+        "records": [
+            encode_record_data(expected_records[0]),
+            {"recordId": "guid2", "result": "Dropped"},
+        ]
+    }
+    reingested_records = mock_put_records_to_firehose_stream.call_args.args[1]
+    assert reingested_records == [{"Data": base64.b64decode(test_records[1]["data"])}]
+
+
+def test_lambda_handler__transforms_everything_before_deadline(mocker):
+    test_records, expected_records = setup_records_for_test(False)
+    test_event = {"deliveryStreamArn": MOCK_STREAM_ARN, "records": test_records}
+    mock_put_records_to_firehose_stream = mocker.patch(PUT_RECORDS_TO_FIREHOSE_PATH)
+
+    actual_output = lambda_handler(test_event, MockContext(60000, time_per_call=1000))
+
+    assert actual_output == {
+        "records": [encode_record_data(record) for record in expected_records]
+    }
+    mock_put_records_to_firehose_stream.assert_not_called()
+
+
+@pytest.mark.parametrize("parallel_processes", ["0", "2"])
+def test_lambda_handler__prints_metrics(
+    monkeypatch, mocker, capsys, parallel_processes
+):
+    monkeypatch.setenv("metrics_enabled", "true")
+    monkeypatch.setenv("parallel_processes", parallel_processes)
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+    test_records, _ = setup_records_for_test(False)
+    test_event = {"deliveryStreamArn": MOCK_STREAM_ARN, "records": test_records}
+    mocker.patch(MAX_LAMBDA_RETURN_PATH, 1)
+    mocker.patch(PUT_RECORDS_TO_FIREHOSE_PATH, return_value=FirehosePutResult())
+
+    lambda_handler(test_event, MockContext(60000))
+
+    emf = get_emf_metrics(capsys.readouterr().out)
+    input_bytes = sum(len(base64.b64decode(record["data"])) for record in test_records)
+    decompressed_bytes = sum(
+        len(gzip.decompress(base64.b64decode(record["data"])))
+        for record in test_records
+    )
+    assert emf["FunctionName"] == "transformation_lambda"
+    assert emf["Records"] == 2
+    assert emf["Events"] == 4
+    assert emf["EventsPerRecord"] == 2
+    assert emf["InputBytes"] == input_bytes
+    assert emf["DecompressedBytes"] == decompressed_bytes
+    assert emf["CompressionRatio"] == decompressed_bytes / input_bytes
+    assert emf["RecordsReingested"] == 2
+    assert emf["RecordsReturned"] == 0
+    metric_names = [
+        metric["Name"] for metric in emf["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    ]
+    for stage in [
+        "Base64DecodeTime",
+        "TransformTime",
+        "SizePlanningTime",
+        "FirehosePutTime",
+        "EncodeTime",
+    ]:
+        assert stage in metric_names
+
+
+def test_lambda_handler__prints_no_metrics_when_disabled(monkeypatch, capsys):
+    monkeypatch.delenv("metrics_enabled", raising=False)
+    test_records, _ = setup_records_for_test(False)
+    test_event = {"deliveryStreamArn": MOCK_STREAM_ARN, "records": test_records}
+
+    lambda_handler(test_event, MockContext(60000))
+
+    assert '"_aws"' not in capsys.readouterr().out
+
+
+def build_record(record_id, lines):
+    data = gzip.compress("".join(f"{line}\n" for line in lines).encode())
+    return {"recordId": record_id, "data": base64.b64encode(data).decode()}
+
+
+def test_process_records__fails_record_with_invalid_line():
+    valid_line = json.dumps(MOCK_EVENT_OBJECT)
+    healthy_record = build_record("guid1", [valid_line])
+    poisoned_record = build_record("guid2", [valid_line, "not json"])
+
+    actual_records = process_records([healthy_record, poisoned_record])
+
+    assert actual_records[0] == {
+        "data": transform_log_event(MOCK_EVENT_OBJECT),
+        "result": "Ok",
+        "recordId": "guid1",
+    }
+    assert actual_records[1]["result"] == "ProcessingFailed"
+    assert actual_records[1]["data"] == poisoned_record["data"]
+    assert actual_records[1]["invalidLines"] == [
+        {
+            "recordId": "guid2",
+            "lineNumber": 1,
+            "error": actual_records[1]["invalidLines"][0]["error"],
+            "line": "not json",
+        }
+    ]
+
+
+def test_process_records__wraps_invalid_line(mocker, monkeypatch):
+    monkeypatch.setenv("invalid_line_mode", "wrap_raw")
+    mocker.patch(
+        "transformation_lambda.transformation_lambda.time.time", return_value=1
+    )
+    valid_line = json.dumps(MOCK_EVENT_OBJECT)
+    poisoned_record = build_record("guid1", [valid_line, "not json"])
+    envelope = create_hec_envelope()
+
+    actual_records = process_records([poisoned_record])
+
+    assert actual_records[0]["result"] == "Ok"
+    assert actual_records[0]["data"] == (
+        f"{transform_log_event(MOCK_EVENT_OBJECT)}"
+        f'{envelope.prefix}1{envelope.event_key}"not json"}}\n'
+    )
+    assert len(actual_records[0]["invalidLines"]) == 1
+
+
+def build_record_with_invalid_utf8_line():
+    valid_line = json.dumps(MOCK_EVENT_OBJECT).encode()
+    data = gzip.compress(valid_line + b"\n" + b'{"bad": "\xff"}\n' + valid_line + b"\n")
+    return {"recordId": "guid1", "data": base64.b64encode(data).decode()}
+
+
+def test_process_records__quarantines_only_the_invalid_utf8_line():
+    poisoned_record = build_record_with_invalid_utf8_line()
+
+    actual_records = process_records([poisoned_record])
+
+    assert actual_records[0]["result"] == "ProcessingFailed"
+    assert actual_records[0]["data"] == poisoned_record["data"]
+    invalid_line = actual_records[0]["invalidLines"][0]
+    assert len(actual_records[0]["invalidLines"]) == 1
+    assert invalid_line["lineNumber"] == 1
+    assert invalid_line["line"] == '{"bad": "\ufffd"}'
+    assert "UnicodeDecodeError" in invalid_line["error"]
+
+
+def test_process_records__wraps_invalid_utf8_line(mocker, monkeypatch):
+    monkeypatch.setenv("invalid_line_mode", "wrap_raw")
+    mocker.patch(
+        "transformation_lambda.transformation_lambda.time.time", return_value=1
+    )
+    envelope = create_hec_envelope()
+
+    actual_records = process_records([build_record_with_invalid_utf8_line()])
+
+    transformed_line = transform_log_event(MOCK_EVENT_OBJECT)
+    wrapped_line = json.dumps('{"bad": "\ufffd"}')
+    assert actual_records[0]["result"] == "Ok"
+    assert actual_records[0]["data"] == (
+        f"{transformed_line}"
+        f"{envelope.prefix}1{envelope.event_key}{wrapped_line}}}\n"
+        f"{transformed_line}"
+    )
+    assert actual_records[0]["invalidLines"][0]["lineNumber"] == 1
+
+
+def test_process_records__fails_record_that_cannot_be_decoded(monkeypatch):
+    monkeypatch.setenv("invalid_line_mode", "wrap_raw")
+    corrupt_record = {
+        "recordId": "guid1",
+        "data": base64.b64encode(b"not gzip").decode(),
+    }
+
+    actual_records = process_records([corrupt_record])
+
+    assert actual_records[0]["result"] == "ProcessingFailed"
+    assert actual_records[0]["data"] == corrupt_record["data"]
+
+
+MOCK_GZIPPED_LINES = gzip.compress(f"{json.dumps(MOCK_EVENT_OBJECT)}\n".encode() * 100)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        MOCK_GZIPPED_LINES[:10] + b"\xff" * 20,
+        MOCK_GZIPPED_LINES[:-12],
+    ],
+)
+def test_process_records__fails_record_with_corrupt_gzip_data(data):
+    corrupt_record = {"recordId": "guid1", "data": base64.b64encode(data).decode()}
+
+    actual_records = process_records([corrupt_record])
+
+    assert actual_records[0]["result"] == "ProcessingFailed"
+    assert [
+        invalid_line["lineNumber"] for invalid_line in actual_records[0]["invalidLines"]
+    ] == [None]
+
+
+def test_process_records__quarantines_events_that_cannot_be_transformed():
+    lines = [json.dumps({"no_timestamp": 1}), json.dumps(["not", "an", "object"])]
+
+    actual_records = process_records([build_record("guid1", lines)])
+
+    invalid_lines = actual_records[0]["invalidLines"]
+    assert actual_records[0]["result"] == "ProcessingFailed"
+    assert [invalid_line["lineNumber"] for invalid_line in invalid_lines] == [0, 1]
+    assert "@timestamp" in invalid_lines[0]["error"]
+    assert "ValueError" in invalid_lines[1]["error"]
+
+
+def test_process_records__raises_configuration_errors(monkeypatch):
+    monkeypatch.setenv("invalid_line_mode", "wrap_raw")
+    monkeypatch.delenv("splunk_host")
+    record = build_record("guid1", [json.dumps(MOCK_EVENT_OBJECT)])
+
+    with pytest.raises(KeyError):
+        process_records([record])
+
+
+def test_get_invalid_line_mode__rejects_unknown_mode(monkeypatch):
+    monkeypatch.setenv("invalid_line_mode", "ignore")
+
+    with pytest.raises(ValueError):
+        get_invalid_line_mode()
+
+
+def test_encode_record_data__processing_failed_keeps_original_data():
+    input_record = {
+        "data": "b3JpZ2luYWw=",
+        "result": "ProcessingFailed",
+        "recordId": "guid1",
+        "invalidLines": [],
+    }
+
+    assert encode_record_data(input_record) == {
+        "data": "b3JpZ2luYWw=",
+        "recordId": "guid1",
+        "result": "ProcessingFailed",
+    }
+
+
+def test_lambda_handler__logs_quarantined_lines(capsys):
+    poisoned_record = build_record("guid1", ["not json"])
+    test_event = {"deliveryStreamArn": MOCK_STREAM_ARN, "records": [poisoned_record]}
+
+    actual_output = lambda_handler(test_event, {})
+
+    assert actual_output == {
+        "records": [
+            {
+                "data": poisoned_record["data"],
+                "recordId": "guid1",
+                "result": "ProcessingFailed",
+            }
+        ]
+    }
+    captured = capsys.readouterr()
+    assert "Quarantined 1 invalid lines" in captured.out
+    assert '"line": "not json"' in captured.out
+
+
+@pytest.mark.parametrize("backend_name", ["stdlib", "orjson"])
+def test_lambda_handler__compact_json_escapes_lone_surrogates(
+    monkeypatch, backend_name
+):
+    if backend_name == "orjson":
+        pytest.importorskip("orjson")
+    monkeypatch.setattr(json_codec, "_backend", json_codec.create_backend(backend_name))
+    monkeypatch.setenv("compact_json", "true")
+    line = '{"@timestamp": 1, "msg": "bad \\ud800 surrogate"}'
+    test_event = {
+        "deliveryStreamArn": MOCK_STREAM_ARN,
+        "records": [build_record("guid1", [line])],
+    }
+
+    actual_output = lambda_handler(test_event, {})
+
+    actual_record = actual_output["records"][0]
+    actual_data = base64.b64decode(actual_record["data"]).decode()
+    assert actual_record["result"] == "Ok"
+    assert '"msg":"bad \\ud800 surrogate"' in actual_data
+    assert json.loads(actual_data)["event"]["msg"] == "bad \ud800 surrogate"
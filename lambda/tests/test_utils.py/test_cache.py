@@ -0,0 +1,57 @@
+from utils import cache
+from utils.cache import cached, get_client, get_or_create
+
+from tests.mock_constants import REGION
+
+
+def test_get_or_create__only_calls_factory_once(mocker):
+    factory = mocker.Mock(return_value="value")
+
+    first_value = get_or_create("key", factory)
+    second_value = get_or_create("key", factory)
+
+    assert first_value == second_value == "value"
+    factory.assert_called_once()
+
+
+def test_get_or_create__does_not_cache_errors(mocker):
+    factory = mocker.Mock(side_effect=[KeyError("not set"), "value"])
+
+    try:
+        get_or_create("key", factory)
+    except KeyError:
+        pass
+
+    assert get_or_create("key", factory) == "value"
+
+
+def test_get_client__reuses_client():
+    first_client = get_client("firehose", REGION)
+    second_client = get_client("firehose", REGION)
+    other_region_client = get_client("firehose", "us-east-1")
+
+    assert first_client is second_client
+    assert first_client is not other_region_client
+    assert first_client.meta.region_name == REGION
+
+
+def test_cached(mocker):
+    function = mocker.Mock(side_effect=lambda value: value * 2)
+    function.__module__ = "test_cache"
+    function.__qualname__ = "double"
+    cached_function = cached(function)
+
+    assert cached_function(2) == 4
+    assert cached_function(2) == 4
+    assert cached_function(3) == 6
+    assert function.call_count == 2
+
+
+def test_reset(mocker):
+    factory = mocker.Mock(return_value="value")
+
+    get_or_create("key", factory)
+    cache.reset()
+    get_or_create("key", factory)
+
+    assert factory.call_count == 2
@@ -0,0 +1,135 @@
+import threading
+import pytest
+from utils.firehose_batch_writer import FirehoseBatchWriter, get_max_in_flight_batches
+from utils.utils import FirehosePutResult
+
+from tests.fake_firehose_client import FakeFirehoseClient
+from tests.mock_constants import MOCK_STREAM_NAME, PUT_RECORDS_TO_FIREHOSE_PATH
+
+
+def test_firehose_batch_writer__flushes_remainder_on_exit():
+    client = FakeFirehoseClient()
+    records = [{"Data": b"1"}, {"Data": b"2"}]
+
+    with FirehoseBatchWriter(MOCK_STREAM_NAME, client) as writer:
+        writer.put_records(records)
+        assert client.calls == []
+
+    assert client.calls == [records]
+    assert writer.result.records_sent == 2
+    assert writer.result.batches_sent == 1
+
+
+def test_firehose_batch_writer__flushes_when_batch_is_full():
+    client = FakeFirehoseClient()
+    records = [{"Data": b"1"}, {"Data": b"2"}, {"Data": b"3"}]
+
+    with FirehoseBatchWriter(MOCK_STREAM_NAME, client, max_batch_records=2) as writer:
+        writer.put_records(records)
+        assert client.calls == [[{"Data": b"1"}, {"Data": b"2"}]]
+
+    assert client.calls == [[{"Data": b"1"}, {"Data": b"2"}], [{"Data": b"3"}]]
+    assert writer.result.batches_sent == 2
+
+
+def test_firehose_batch_writer__flushes_before_batch_size_overflows():
+    client = FakeFirehoseClient()
+    records = [{"Data": b"123"}, {"Data": b"45"}, {"Data": b"6"}]
+
+    with FirehoseBatchWriter(MOCK_STREAM_NAME, client, max_batch_size=5) as writer:
+        writer.put_records(records)
+
+    assert client.calls == [[{"Data": b"123"}, {"Data": b"45"}], [{"Data": b"6"}]]
+
+
+def test_firehose_batch_writer__does_not_flush_after_error():
+    client = FakeFirehoseClient()
+
+    with pytest.raises(ValueError):
+        with FirehoseBatchWriter(MOCK_STREAM_NAME, client) as writer:
+            writer.put({"Data": b"1"})
+            raise ValueError("failed to produce records")
+
+    assert client.calls == []
+
+
+def test_firehose_batch_writer__collects_results_across_flushes(mocker):
+    mocker.patch("utils.utils.FIREHOSE_RETRY_BASE_DELAY", 0)
+    client = FakeFirehoseClient(throttled_calls=1)
+
+    with FirehoseBatchWriter(MOCK_STREAM_NAME, client, max_batch_records=1) as writer:
+        writer.put_records([{"Data": b"1"}, {"Data": b"2"}])
+
+    assert writer.result.records_sent == 2
+    assert writer.result.attempts == 3
+    assert len(writer.result.delays) == 1
+    assert writer.result.failure_counts == {"ServiceUnavailableException": 1}
+
+
+def test_firehose_batch_writer__sends_batches_concurrently():
+    client = FakeFirehoseClient()
+    records = [{"Data": str(index).encode()} for index in range(5)]
+
+    with FirehoseBatchWriter(
+        MOCK_STREAM_NAME, client, max_batch_records=1, max_in_flight=3
+    ) as writer:
+        writer.put_records(records)
+
+    assert sorted(client.delivered_records, key=lambda record: record["Data"]) == (
+        records
+    )
+    assert writer.result.records_sent == 5
+    assert writer.result.batches_sent == 5
+
+
+def test_firehose_batch_writer__limits_batches_in_flight(mocker):
+    release_sends = threading.Event()
+    in_flight = []
+    max_in_flight = []
+
+    def send_batch(*args, **kwargs):
+        in_flight.append(1)
+        max_in_flight.append(len(in_flight))
+        release_sends.wait(1)
+        in_flight.pop()
+        return FirehosePutResult(records_sent=1, batches_sent=1)
+
+    mocker.patch(PUT_RECORDS_TO_FIREHOSE_PATH, side_effect=send_batch)
+    threading.Timer(0.1, release_sends.set).start()
+
+    with FirehoseBatchWriter(
+        MOCK_STREAM_NAME, FakeFirehoseClient(), max_batch_records=1, max_in_flight=2
+    ) as writer:
+        writer.put_records([{"Data": b"1"}, {"Data": b"2"}, {"Data": b"3"}])
+
+    assert max(max_in_flight) <= 2
+    assert writer.result.records_sent == 3
+
+
+def test_firehose_batch_writer__raises_failed_concurrent_send(mocker):
+    mocker.patch(
+        PUT_RECORDS_TO_FIREHOSE_PATH,
+        side_effect=[
+            FirehosePutResult(records_sent=1, batches_sent=1),
+            RuntimeError("Could not put records after 20 attempts."),
+        ],
+    )
+
+    with pytest.raises(RuntimeError) as error_content:
+        with FirehoseBatchWriter(
+            MOCK_STREAM_NAME, FakeFirehoseClient(), max_batch_records=1, max_in_flight=2
+        ) as writer:
+            writer.put_records([{"Data": b"1"}, {"Data": b"2"}])
+
+    assert "Could not put records after 20 attempts." in str(error_content.value)
+    assert writer.executor is None
+
+
+def test_get_max_in_flight_batches(monkeypatch):
+    monkeypatch.setenv("max_in_flight_batches", "8")
+    assert get_max_in_flight_batches() == 8
+
+
+def test_get_max_in_flight_batches__defaults(monkeypatch):
+    monkeypatch.delenv("max_in_flight_batches", raising=False)
+    assert get_max_in_flight_batches() == 4
@@ -0,0 +1,134 @@
+import json
+import pytest
+from utils import json_codec
+from utils.json_codec import (
+    OrjsonBackend,
+    StdlibBackend,
+    create_backend,
+    dumpb,
+    dumps,
+    loads,
+    set_backend,
+)
+
+from tests.mock_constants import (
+    FILEPATH_FOR_TEST_FOLDER,
+    MOCK_BUCKET_NAME,
+    MOCK_EVENT_OBJECT,
+)
+
+with open(
+    f"{FILEPATH_FOR_TEST_FOLDER}/test_transformation_lambda/mock_data_from_s3.json"
+) as mock_data_file:
+    MOCK_AUDIT_LOG_LINES = mock_data_file.read().splitlines()
+
+EVENT_SHAPES = [
+    MOCK_EVENT_OBJECT,
+    *[json.loads(line) for line in MOCK_AUDIT_LOG_LINES[:5]],
+    {
+        "sourcetype": "aws:firehose",
+        "source": "aws:reingested",
+        "event": {"key": "value"},
+        "fields": {"reingest": 2, "origin_bucket_name": MOCK_BUCKET_NAME},
+    },
+    {"unicode": "café ☃ \U0001f600", "escapes": 'quote " slash \\ tab \t'},
+    {"numbers": [0, -1, 2**63 - 1, 1.5, -0.25], "flags": [True, False, None]},
+    {"nested": {"list": [{"a": []}, {}], "empty": ""}},
+    {"wide": 2**70, "negative_wide": -(2**70), "unsigned": 2**64 - 1},
+    {"nan": float("nan")},
+    {"infinity": float("inf"), "negative_infinity": float("-inf")},
+    {"surrogate": "\ud800"},
+    "a plain string event",
+    1234567890,
+]
+
+BACKENDS = ["stdlib", "orjson"]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    previous_backend = json_codec.get_backend()
+    yield set_backend(request.param)
+    set_backend(previous_backend.name)
+
+
+@pytest.mark.parametrize("event", EVENT_SHAPES)
+def test_loads__matches_stdlib(backend, event):
+    line = json.dumps(event)
+    # NaN never compares equal, so the decoded values are compared re-encoded.
+    assert json.dumps(loads(line)) == line
+    assert json.dumps(loads(line.encode())) == line
+
+
+@pytest.mark.parametrize("event", EVENT_SHAPES)
+def test_dumps__default_layout_matches_stdlib(backend, event):
+    assert dumps(event) == json.dumps(event)
+    assert dumpb(event) == json.dumps(event).encode()
+
+
+@pytest.mark.parametrize("event", EVENT_SHAPES)
+def test_dumps__compact_layout_is_equivalent_across_backends(event):
+    pytest.importorskip("orjson")
+    event = OrjsonBackend().loads(json.dumps(event))
+    stdlib_output = StdlibBackend().dumps_compact(event)
+    orjson_output = OrjsonBackend().dumps_compact(event)
+
+    assert orjson_output == stdlib_output
+    assert OrjsonBackend().dumpb_compact(event) == StdlibBackend().dumpb_compact(event)
+    assert json.dumps(json.loads(orjson_output)) == json.dumps(event)
+
+
+def test_dumps__compact_falls_back_for_wide_integers():
+    pytest.importorskip("orjson")
+    event = {"big": 2**70}
+    assert OrjsonBackend().dumps_compact(event) == '{"big":1180591620717411303424}'
+
+
+def test_dumps__default(backend):
+    assert dumps({"date": object}, default=lambda _: "converted") == (
+        '{"date": "converted"}'
+    )
+
+
+def test_loads__wide_integer_is_not_a_float(backend):
+    assert loads('{"id": 1180591620717411303424}') == {"id": 2**70}
+    assert loads(b'{"id": 1180591620717411303424}') == {"id": 2**70}
+
+
+def test_dumpb__compact_escapes_lone_surrogates(backend):
+    assert dumpb({"surrogate": "\ud800"}, compact=True) == b'{"surrogate":"\\ud800"}'
+
+
+def test_dumps__compact_escapes_lone_surrogates(backend):
+    output = dumps({"surrogate": "\ud800", "text": "café"}, compact=True)
+    assert output == '{"surrogate":"\\ud800","text":"caf\\u00e9"}'
+    output.encode()
+
+
+def test_dumps__compact_keeps_null(backend):
+    event = loads('{"missing": null, "text": "null"}')
+    assert dumps(event, compact=True) == '{"missing":null,"text":"null"}'
+
+
+def test_dumps__compact_keeps_decoded_non_finite_floats(backend):
+    event = loads('{"nan": NaN, "list": [Infinity, -Infinity, null]}')
+    assert dumps(event, compact=True) == (
+        '{"nan":NaN,"list":[Infinity,-Infinity,null]}'
+    )
+
+
+def test_orjson_encode__accepts_output_with_null():
+    pytest.importorskip("orjson")
+    assert OrjsonBackend().encode({"missing": None}) == b'{"missing":null}'
+
+
+def test_create_backend__unknown():
+    with pytest.raises(ValueError):
+        create_backend("unknown")
+
+
+def test_create_backend__auto():
+    expected_name = "stdlib" if json_codec.orjson is None else "orjson"
+    assert create_backend("auto").name == expected_name
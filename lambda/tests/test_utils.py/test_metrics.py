@@ -0,0 +1,129 @@
+import threading
+import pytest
+from utils import metrics
+
+from tests.emf_output import get_emf_metrics
+
+
+def test_invocation__prints_one_emf_line(monkeypatch, capsys):
+    monkeypatch.setenv("metrics_enabled", "true")
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+
+    with metrics.invocation("test_function"):
+        metrics.add("Records", 2)
+        metrics.add("Records", 3)
+        metrics.add("InputBytes", 100, metrics.BYTES)
+
+    emf = get_emf_metrics(capsys.readouterr().out)
+
+    assert emf["FunctionName"] == "test_function"
+    assert emf["Records"] == 5
+    assert emf["InputBytes"] == 100
+    cloudwatch_metrics = emf["_aws"]["CloudWatchMetrics"][0]
+    assert cloudwatch_metrics["Namespace"] == metrics.DEFAULT_NAMESPACE
+    assert cloudwatch_metrics["Dimensions"] == [["FunctionName"]]
+    assert cloudwatch_metrics["Metrics"] == [
+        {"Name": "InputBytes", "Unit": "Bytes"},
+        {"Name": "Records", "Unit": "Count"},
+    ]
+
+
+def test_invocation__uses_lambda_function_name_and_namespace(monkeypatch, capsys):
+    monkeypatch.setenv("metrics_enabled", "true")
+    monkeypatch.setenv("metrics_namespace", "TestNamespace")
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "deployed_function")
+
+    with metrics.invocation("test_function"):
+        metrics.add("Records", 1)
+
+    emf = get_emf_metrics(capsys.readouterr().out)
+
+    assert emf["FunctionName"] == "deployed_function"
+    assert emf["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "TestNamespace"
+
+
+def test_invocation__prints_metrics_when_handler_raises(monkeypatch, capsys):
+    monkeypatch.setenv("metrics_enabled", "true")
+
+    @metrics.invocation("test_function")
+    def handler():
+        metrics.add("Records", 1)
+        raise ValueError("handler failed")
+
+    with pytest.raises(ValueError):
+        handler()
+
+    assert get_emf_metrics(capsys.readouterr().out)["Records"] == 1
+    assert metrics.get_metrics() is metrics.NULL_METRICS
+
+
+def test_invocation__prints_nothing_when_disabled(monkeypatch, capsys):
+    monkeypatch.delenv("metrics_enabled", raising=False)
+
+    with metrics.invocation("test_function") as invocation_metrics:
+        metrics.add("Records", 1)
+        with metrics.timer("TransformTime"):
+            pass
+
+    assert invocation_metrics is metrics.NULL_METRICS
+    assert capsys.readouterr().out == ""
+
+
+def test_add__outside_invocation_is_ignored(capsys):
+    metrics.add("Records", 1)
+
+    assert metrics.get_metrics().get("Records") == 0
+    assert capsys.readouterr().out == ""
+
+
+def test_timer__adds_elapsed_milliseconds(monkeypatch):
+    invocation_metrics = metrics.Metrics("TestNamespace", "test_function")
+    perf_counter_values = iter([1.0, 1.25, 2.0, 2.5])
+    monkeypatch.setattr(metrics.time, "perf_counter", lambda: next(perf_counter_values))
+
+    with invocation_metrics.timer("TransformTime"):
+        pass
+    with invocation_metrics.timer("TransformTime"):
+        pass
+
+    assert invocation_metrics.values == {"TransformTime": (750.0, "Milliseconds")}
+
+
+def test_add_ratio():
+    invocation_metrics = metrics.Metrics("TestNamespace", "test_function")
+    invocation_metrics.add("DecompressedBytes", 1000, metrics.BYTES)
+    invocation_metrics.add("InputBytes", 250, metrics.BYTES)
+
+    invocation_metrics.add_ratio("CompressionRatio", "DecompressedBytes", "InputBytes")
+    invocation_metrics.add_ratio("EventsPerRecord", "Events", "Records")
+
+    assert invocation_metrics.get("CompressionRatio") == 4
+    assert "EventsPerRecord" not in invocation_metrics.values
+
+
+def test_take_values_and_merge():
+    worker_metrics = metrics.Metrics("TestNamespace", "test_function")
+    worker_metrics.add("Events", 3)
+    parent_metrics = metrics.Metrics("TestNamespace", "test_function")
+    parent_metrics.add("Events", 2)
+
+    parent_metrics.merge(worker_metrics.take_values())
+
+    assert parent_metrics.get("Events") == 5
+    assert worker_metrics.values == {}
+
+
+def test_add__from_threads():
+    invocation_metrics = metrics.Metrics("TestNamespace", "test_function")
+
+    def add_many():
+        for _ in range(1000):
+            invocation_metrics.add("Records", 1)
+
+    threads = [threading.Thread(target=add_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert invocation_metrics.get("Records") == 4000
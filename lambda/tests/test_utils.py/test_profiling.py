@@ -0,0 +1,115 @@
+import pytest
+from utils import profiling
+from utils.profiling import (
+    ProfilingSettings,
+    get_profiling_settings,
+    is_sampled,
+    profiled,
+)
+
+
+class MockRequestContext:
+    aws_request_id = "test-request-id"
+
+
+@profiled
+def lambda_handler(event, _context):
+    if event.get("fail"):
+        raise ValueError("handler failed")
+    return [str(number) for number in range(event["count"])]
+
+
+def test_get_profiling_settings(monkeypatch):
+    monkeypatch.setenv("profile_sample_rate", "0.25")
+    monkeypatch.setenv("profile_mode", "memory")
+    monkeypatch.setenv("profile_top_n", "5")
+    monkeypatch.setenv("profile_output_dir", "/tmp")
+
+    assert get_profiling_settings() == ProfilingSettings(0.25, "memory", 5, "/tmp")
+
+
+def test_get_profiling_settings__not_set(monkeypatch):
+    for name in [
+        "profile_sample_rate",
+        "profile_mode",
+        "profile_top_n",
+        "profile_output_dir",
+    ]:
+        monkeypatch.delenv(name, raising=False)
+
+    assert get_profiling_settings() == ProfilingSettings()
+
+
+def test_get_profiling_settings__unknown_mode(monkeypatch):
+    monkeypatch.setenv("profile_mode", "everything")
+
+    with pytest.raises(ValueError):
+        get_profiling_settings()
+
+
+def test_is_sampled():
+    settings = ProfilingSettings(sample_rate=0.5)
+
+    assert is_sampled(settings, lambda: 0.4)
+    assert not is_sampled(settings, lambda: 0.5)
+    assert not is_sampled(ProfilingSettings(sample_rate=0), lambda: 0)
+
+
+def test_profiled__not_sampled(monkeypatch, capsys, mocker):
+    monkeypatch.delenv("profile_sample_rate", raising=False)
+    mock_run_profiled = mocker.patch("utils.profiling.run_profiled")
+
+    assert lambda_handler({"count": 2}, MockRequestContext()) == ["0", "1"]
+
+    mock_run_profiled.assert_not_called()
+    assert capsys.readouterr().out == ""
+
+
+def test_profiled__prints_cpu_profile(monkeypatch, capsys):
+    monkeypatch.setenv("profile_sample_rate", "1")
+    monkeypatch.delenv("profile_output_dir", raising=False)
+
+    assert lambda_handler({"count": 2}, MockRequestContext()) == ["0", "1"]
+
+    output = capsys.readouterr().out
+    assert "Profile of test_profiling-test-request-id:" in output
+    assert "function calls" in output
+    assert "lambda_handler" in output
+
+
+def test_profiled__prints_memory_profile(monkeypatch, capsys):
+    monkeypatch.setenv("profile_sample_rate", "1")
+    monkeypatch.setenv("profile_mode", "memory")
+    monkeypatch.delenv("profile_output_dir", raising=False)
+
+    lambda_handler({"count": 1000}, MockRequestContext())
+
+    output = capsys.readouterr().out
+    assert "Peak traced memory:" in output
+    assert "test_profiling.py" in output
+    assert "function calls" not in output
+    assert not profiling.tracemalloc.is_tracing()
+
+
+def test_profiled__writes_to_output_dir(monkeypatch, capsys, tmp_path):
+    monkeypatch.setenv("profile_sample_rate", "1")
+    monkeypatch.setenv("profile_mode", "cpu_and_memory")
+    monkeypatch.setenv("profile_output_dir", str(tmp_path))
+
+    lambda_handler({"count": 2}, MockRequestContext())
+
+    report = (tmp_path / "test_profiling-test-request-id.txt").read_text()
+    assert "function calls" in report
+    assert "Peak traced memory:" in report
+    assert (tmp_path / "test_profiling-test-request-id.prof").exists()
+    assert str(tmp_path) in capsys.readouterr().out
+
+
+def test_profiled__reports_when_handler_raises(monkeypatch, capsys):
+    monkeypatch.setenv("profile_sample_rate", "1")
+    monkeypatch.delenv("profile_output_dir", raising=False)
+
+    with pytest.raises(ValueError):
+        lambda_handler({"fail": True}, MockRequestContext())
+
+    assert "function calls" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+import pytest
+from utils.s3_notifications import (
+    S3ObjectResult,
+    get_bucket_name_and_key,
+    get_max_concurrent_objects,
+    get_s3_objects_from_event,
+    process_s3_objects,
+    raise_for_failed_objects,
+)
+
+from tests.mock_constants import MOCK_BUCKET_NAME
+
+
+def build_notification_record(bucket_name, key):
+    return {"s3": {"bucket": {"name": bucket_name}, "object": {"key": key}}}
+
+
+def test_get_bucket_name_and_key():
+    record = build_notification_record(MOCK_BUCKET_NAME, "some+folder/file%3D1.gz")
+
+    actual_bucket_name, actual_key = get_bucket_name_and_key(record)
+
+    assert actual_bucket_name == MOCK_BUCKET_NAME
+    assert actual_key == "some folder/file=1.gz"
+
+
+def test_get_s3_objects_from_event():
+    event = {
+        "Records": [
+            build_notification_record(MOCK_BUCKET_NAME, "key1"),
+            build_notification_record(MOCK_BUCKET_NAME, "key2"),
+        ]
+    }
+
+    actual_objects = get_s3_objects_from_event(event)
+
+    assert actual_objects == [(MOCK_BUCKET_NAME, "key1"), (MOCK_BUCKET_NAME, "key2")]
+
+
+def test_get_max_concurrent_objects(monkeypatch):
+    monkeypatch.setenv("max_concurrent_objects", "3")
+    assert get_max_concurrent_objects() == 3
+
+
+def test_get_max_concurrent_objects__not_set(monkeypatch):
+    monkeypatch.delenv("max_concurrent_objects", raising=False)
+    assert get_max_concurrent_objects() == 10
+
+
+def test_process_s3_objects__processes_every_object_in_order():
+    s3_objects = [(MOCK_BUCKET_NAME, f"key{index}") for index in range(5)]
+
+    actual_results = process_s3_objects(
+        s3_objects, lambda bucket_name, key: f"{bucket_name}/{key}", 2
+    )
+
+    assert actual_results == [
+        S3ObjectResult(
+            MOCK_BUCKET_NAME, f"key{index}", f"{MOCK_BUCKET_NAME}/key{index}"
+        )
+        for index in range(5)
+    ]
+
+
+def test_process_s3_objects__isolates_failures():
+    s3_objects = [(MOCK_BUCKET_NAME, "bad key"), (MOCK_BUCKET_NAME, "good key")]
+    error = ValueError("bad object")
+
+    def process_object(_bucket_name, key):
+        if key == "bad key":
+            raise error
+        return "ok"
+
+    actual_results = process_s3_objects(s3_objects, process_object, 2)
+
+    assert actual_results == [
+        S3ObjectResult(MOCK_BUCKET_NAME, "bad key", error=error),
+        S3ObjectResult(MOCK_BUCKET_NAME, "good key", response="ok"),
+    ]
+
+
+def test_raise_for_failed_objects(capfd):
+    error = ValueError("bad object")
+    results = [
+        S3ObjectResult(MOCK_BUCKET_NAME, "bad key", error=error),
+        S3ObjectResult(MOCK_BUCKET_NAME, "good key", response="ok"),
+    ]
+
+    with pytest.raises(ValueError) as error_content:
+        raise_for_failed_objects(results)
+    actual_log, _ = capfd.readouterr()
+
+    assert error_content.value is error
+    assert "Processed 1 of 2 objects\n" in actual_log
+    assert (
+        f"Failed to process s3://{MOCK_BUCKET_NAME}/bad key: bad object" in actual_log
+    )
+
+
+def test_raise_for_failed_objects__no_failures():
+    results = [S3ObjectResult(MOCK_BUCKET_NAME, "good key", response="ok")]
+    raise_for_failed_objects(results)
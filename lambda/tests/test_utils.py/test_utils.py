@@ -1,15 +1,37 @@
 import gzip
+import io
 import pytest
 import boto3
+from botocore.exceptions import (
+    ClientError,
+    EndpointConnectionError,
+    ParamValidationError,
+    ReadTimeoutError,
+)
 from moto import mock_firehose, mock_s3
-from utils.utils import put_records_to_firehose_stream
+from utils import metrics
+from utils.utils import (
+    get_backoff_delay,
+    is_deadline_near,
+    iter_lines,
+    put_records_to_firehose_stream,
+    split_lines_into_chunks,
+    split_records_into_batches,
+)
 
+from tests.emf_output import get_emf_metrics
+from tests.fake_firehose_client import FakeFirehoseClient
+from tests.mock_context import MockContext
 from tests.mock_constants import (
     MOCK_EVENT_STRING,
     MOCK_STREAM_NAME,
 )
 
 
+def no_sleep(_delay):
+    pass
+
+
 @mock_s3
 @mock_firehose
 def test_put_records_to_firehose_stream():
@@ -46,14 +68,14 @@ def test_put_records_to_firehose_stream():
 
 
 def test_put_records_to_firehose_stream__raises_error():
-    firehose_client = {}
+    firehose_client = FakeFirehoseClient(throttled_calls=2)
 
     zipped_mock_event = gzip.compress(MOCK_EVENT_STRING.encode())
     mock_record = [{"Data": zipped_mock_event}]
 
     with pytest.raises(RuntimeError) as error_content:
         put_records_to_firehose_stream(
-            MOCK_STREAM_NAME, mock_record, firehose_client, 0, 2
+            MOCK_STREAM_NAME, mock_record, firehose_client, 0, 2, sleep=no_sleep
         )
     assert "Could not put records after 2 attempts." in str(error_content.value)
 
@@ -108,3 +130,228 @@ def test_put_records_to_firehose_stream__handles_failed_puts_with_no_error_code(
 
     error_codes = str(error_content.value).split(": ")[1]
     assert error_codes == "some error"
+
+
+def test_put_records_to_firehose_stream__retries_throttled_calls_with_backoff():
+    client = FakeFirehoseClient(throttled_calls=3)
+    sleeps = []
+    records = [{"Data": b"1"}, {"Data": b"2"}]
+
+    result = put_records_to_firehose_stream(
+        MOCK_STREAM_NAME,
+        records,
+        client,
+        sleep=sleeps.append,
+        random_function=lambda: 1,
+    )
+
+    assert client.delivered_records == records
+    assert result.attempts == 4
+    assert result.delays == [0.05, 0.1, 0.2]
+    assert sleeps == result.delays
+    assert result.failure_counts == {"ServiceUnavailableException": 6}
+
+
+def test_put_records_to_firehose_stream__records_retry_metrics(monkeypatch, capsys):
+    monkeypatch.setenv("metrics_enabled", "true")
+    client = FakeFirehoseClient(throttled_calls=2)
+    records = [{"Data": b"1"}, {"Data": b"2"}]
+
+    with metrics.invocation("test_function"):
+        put_records_to_firehose_stream(
+            MOCK_STREAM_NAME, records, client, sleep=no_sleep
+        )
+
+    emf = get_emf_metrics(capsys.readouterr().out)
+    assert emf["FirehoseRecordsSent"] == 2
+    assert emf["FirehoseBatchesSent"] == 1
+    assert emf["FirehoseRetries"] == 2
+    assert emf["FirehoseFailedRecords"] == 4
+
+
+@pytest.mark.parametrize(
+    "error_code",
+    ["InvalidArgumentException", "ResourceNotFoundException", "AccessDeniedException"],
+)
+def test_put_records_to_firehose_stream__does_not_retry_other_errors(error_code):
+    client = FakeFirehoseClient(throttled_calls=1, error_code=error_code)
+    sleeps = []
+
+    with pytest.raises(ClientError) as error_content:
+        put_records_to_firehose_stream(
+            MOCK_STREAM_NAME, [{"Data": b"1"}], client, sleep=sleeps.append
+        )
+
+    assert error_content.value.response["Error"]["Code"] == error_code
+    assert len(client.calls) == 1
+    assert sleeps == []
+
+
+@mock_firehose
+def test_put_records_to_firehose_stream__does_not_retry_validation_errors():
+    firehose_client = boto3.client("firehose", region_name="eu-west-2")
+    sleeps = []
+
+    with pytest.raises(ParamValidationError):
+        put_records_to_firehose_stream(
+            MOCK_STREAM_NAME,
+            [{"Data": b"1", "PartitionKey": "1"}],
+            firehose_client,
+            sleep=sleeps.append,
+        )
+
+    assert sleeps == []
+
+
+def test_put_records_to_firehose_stream__does_not_retry_unexpected_errors():
+    client = FakeFirehoseClient(errors=[TypeError("unexpected")])
+    sleeps = []
+
+    with pytest.raises(TypeError):
+        put_records_to_firehose_stream(
+            MOCK_STREAM_NAME, [{"Data": b"1"}], client, sleep=sleeps.append
+        )
+
+    assert len(client.calls) == 1
+    assert sleeps == []
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        EndpointConnectionError(endpoint_url="https://firehose"),
+        ReadTimeoutError(endpoint_url="https://firehose"),
+    ],
+)
+def test_put_records_to_firehose_stream__retries_connection_errors(error):
+    client = FakeFirehoseClient(errors=[error])
+    sleeps = []
+
+    put_records_to_firehose_stream(
+        MOCK_STREAM_NAME, [{"Data": b"1"}], client, sleep=sleeps.append
+    )
+
+    assert len(client.calls) == 2
+    assert len(sleeps) == 1
+    assert client.delivered_records == [{"Data": b"1"}]
+
+
+def test_put_records_to_firehose_stream__does_not_retry_oversized_batches():
+    client = FakeFirehoseClient()
+    record = {"Data": b"x" * 1024001}
+
+    with pytest.raises(ClientError):
+        put_records_to_firehose_stream(
+            MOCK_STREAM_NAME, [record] * 5, client, sleep=no_sleep
+        )
+
+    assert len(client.calls) == 1
+
+
+def test_put_records_to_firehose_stream__retries_only_failed_records():
+    client = FakeFirehoseClient(partially_failed_calls=1, error_code="ThrottlingError")
+    records = [{"Data": b"1"}, {"Data": b"2"}, {"Data": b"3"}]
+
+    result = put_records_to_firehose_stream(
+        MOCK_STREAM_NAME, records, client, sleep=no_sleep
+    )
+
+    assert client.calls == [records, [{"Data": b"1"}, {"Data": b"3"}]]
+    assert sorted(record["Data"] for record in client.delivered_records) == [
+        b"1",
+        b"2",
+        b"3",
+    ]
+    assert result.records_sent == 3
+    assert result.failure_counts == {"ThrottlingError": 2}
+
+
+def test_put_records_to_firehose_stream__splits_records_to_api_limits(mocker):
+    mocker.patch("utils.utils.FIREHOSE_MAX_BATCH_RECORDS", 2)
+    mocker.patch("tests.fake_firehose_client.FIREHOSE_MAX_BATCH_RECORDS", 2)
+    client = FakeFirehoseClient()
+    records = [{"Data": b"1"}, {"Data": b"2"}, {"Data": b"3"}]
+
+    result = put_records_to_firehose_stream(
+        MOCK_STREAM_NAME, iter(records), client, sleep=no_sleep
+    )
+
+    assert client.calls == [[{"Data": b"1"}, {"Data": b"2"}], [{"Data": b"3"}]]
+    assert result.batches_sent == 2
+    assert result.records_sent == 3
+    assert result.attempts == 2
+    assert result.delays == []
+
+
+def test_put_records_to_firehose_stream__gives_up_after_max_attempts():
+    client = FakeFirehoseClient(throttled_calls=10)
+
+    with pytest.raises(RuntimeError) as error_content:
+        put_records_to_firehose_stream(
+            MOCK_STREAM_NAME, [{"Data": b"1"}], client, 0, 3, sleep=no_sleep
+        )
+
+    assert "Could not put records after 3 attempts." in str(error_content.value)
+    assert len(client.calls) == 3
+
+
+def test_get_backoff_delay__is_capped():
+    assert get_backoff_delay(0, 0.05, 2, lambda: 1) == 0.05
+    assert get_backoff_delay(3, 0.05, 2, lambda: 1) == 0.4
+    assert get_backoff_delay(10, 0.05, 2, lambda: 1) == 2
+    assert get_backoff_delay(10, 0.05, 2, lambda: 0.5) == 1
+
+
+def test_split_records_into_batches__by_record_count(mocker):
+    mocker.patch("utils.utils.FIREHOSE_MAX_BATCH_RECORDS", 2)
+    records = [{"Data": b"1"}, {"Data": b"2"}, {"Data": b"3"}]
+
+    actual_batches = list(split_records_into_batches(records))
+
+    assert actual_batches == [[{"Data": b"1"}, {"Data": b"2"}], [{"Data": b"3"}]]
+
+
+def test_split_records_into_batches__by_batch_size(mocker):
+    mocker.patch("utils.utils.FIREHOSE_MAX_BATCH_SIZE", 5)
+    records = [{"Data": b"123"}, {"Data": b"45"}, {"Data": b"6"}]
+
+    actual_batches = list(split_records_into_batches(records))
+
+    assert actual_batches == [[{"Data": b"123"}, {"Data": b"45"}], [{"Data": b"6"}]]
+
+
+def test_split_lines_into_chunks():
+    contents = b"line 1\nline 2\nline 3\nline 4"
+
+    actual_chunks = list(split_lines_into_chunks(contents, 14))
+
+    assert actual_chunks == [b"line 1\nline 2\n", b"line 3\nline 4"]
+
+
+def test_split_lines_into_chunks__line_longer_than_target():
+    contents = b"a very long line\nshort\n"
+
+    actual_chunks = list(split_lines_into_chunks(contents, 5))
+
+    assert actual_chunks == [b"a very long line\n", b"short\n"]
+
+
+def test_iter_lines__from_string():
+    assert list(iter_lines("line 1\n\nline 2\r\nline 3")) == [
+        "line 1",
+        "line 2\r",
+        "line 3",
+    ]
+
+
+def test_iter_lines__from_binary_file_object():
+    contents = io.BytesIO(gzip.compress(b"line 1\nline 2\n"))
+
+    with gzip.GzipFile(fileobj=contents) as file_object:
+        assert list(iter_lines(file_object)) == ["line 1", "line 2"]
+
+
+def test_is_deadline_near():
+    assert is_deadline_near(MockContext(1000), 5000)
+    assert not is_deadline_near(MockContext(10000), 5000)
+    assert not is_deadline_near({}, 5000)
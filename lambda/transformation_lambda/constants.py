@@ -1,3 +1,12 @@
-MAX_BATCH_LENGTH = 400
 MAX_LAMBDA_RETURN_SIZE = 6000000
-MAX_REINGESTION_ATTEMPTS = 20
+# Reingested records are gzipped after packing, so this leaves headroom under
+# the Firehose record size limit for the gzip framing of incompressible data.
+MAX_REINGEST_RECORD_SIZE = 1000000
+# Time left for reingesting the records that were not transformed and for
+# returning the response once the handler stops transforming.
+DEFAULT_DEADLINE_MARGIN_MS = 20000
+# How a line that cannot be transformed is handled. FAIL_RECORD returns its
+# whole record as ProcessingFailed, WRAP_RAW sends the line as a string event.
+FAIL_RECORD = "fail_record"
+WRAP_RAW = "wrap_raw"
+MAX_QUARANTINED_LINE_LENGTH = 1000
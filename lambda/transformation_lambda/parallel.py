@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import traceback
+from utils import metrics
+
+# Lambda has no /dev/shm, so multiprocessing.Pool and Queue cannot be used.
+# Each worker is a plain Process that returns its results over a Pipe.
+FORK_CONTEXT = multiprocessing.get_context("fork")
+
+
+def get_parallel_processes():
+    try:
+        parallel_processes = int(os.environ["parallel_processes"])
+    except Exception:
+        parallel_processes = 0
+    return parallel_processes
+
+
+def split_into_chunks(items, chunk_count):
+    chunk_size, remainder = divmod(len(items), chunk_count)
+    chunks = []
+    start = 0
+
+    for index in range(chunk_count):
+        end = start + chunk_size + (1 if index < remainder else 0)
+        if end > start:
+            chunks.append(items[start:end])
+        start = end
+
+    return chunks
+
+
+def run_worker(function, chunk, connection):
+    # The forked worker starts with a copy of the parent's metrics, so they are
+    # cleared and only the metrics it records itself are sent back.
+    worker_metrics = metrics.get_metrics()
+    worker_metrics.take_values()
+    try:
+        result = function(chunk)
+        connection.send(("ok", result, worker_metrics.take_values()))
+    except Exception:
+        connection.send(("error", traceback.format_exc(), {}))
+    finally:
+        connection.close()
+
+
+def map_in_processes(function, items, process_count):
+    workers = []
+
+    for chunk in split_into_chunks(items, process_count):
+        receive_connection, send_connection = FORK_CONTEXT.Pipe(duplex=False)
+        process = FORK_CONTEXT.Process(
+            target=run_worker, args=(function, chunk, send_connection)
+        )
+        process.start()
+        send_connection.close()
+        workers.append((process, receive_connection))
+
+    results = []
+    errors = []
+
+    # Results are read in the order the chunks were created, which keeps the
+    # output in the same order as the input.
+    for process, receive_connection in workers:
+        try:
+            status, result, worker_metrics = receive_connection.recv()
+        except EOFError:
+            status, result, worker_metrics = (
+                "error",
+                "Worker process exited without a result.",
+                {},
+            )
+        receive_connection.close()
+        process.join()
+        metrics.get_metrics().merge(worker_metrics)
+
+        if status == "ok":
+            results.extend(result)
+        else:
+            errors.append(result)
+
+    if errors:
+        raise RuntimeError(f"Parallel processing failed: {errors[0]}")
+
+    return results
@@ -1,27 +1,132 @@
+import base64
 import gzip
-import json
 from transformation_lambda.constants import (
-    MAX_BATCH_LENGTH,
     MAX_LAMBDA_RETURN_SIZE,
+    MAX_REINGEST_RECORD_SIZE,
 )
+from utils import json_codec
+from utils.utils import split_lines_into_chunks
+
+
+# Sizes of the JSON the Lambda runtime writes for the handler response, with
+# every string value left empty.
+RESPONSE_OVERHEAD = len(json_codec.dumps({"records": []}))
+RECORD_SEPARATOR_SIZE = len(", ")
+KEPT_RECORD_OVERHEAD = len(json_codec.dumps({"data": "", "recordId": "", "result": ""}))
+DROPPED_RECORD_OVERHEAD = len(json_codec.dumps({"recordId": "", "result": ""}))
+
+
+def get_encoded_data_size(data):
+    data_size = len(data) if data.isascii() else len(data.encode())
+    return 4 * ((data_size + 2) // 3)
+
+
+def get_string_size(value):
+    return len(json_codec.dumps(value)) - 2
+
+
+def get_kept_record_size(record):
+    # The data of a failed record is returned as it was received, already
+    # base64 encoded.
+    if record["result"] == "ProcessingFailed":
+        data_size = len(record["data"])
+    else:
+        data_size = get_encoded_data_size(record["data"])
+
+    return (
+        KEPT_RECORD_OVERHEAD
+        + data_size
+        + get_string_size(record["recordId"])
+        + get_string_size(record["result"])
+    )
+
+
+def get_dropped_record_size(record):
+    return (
+        DROPPED_RECORD_OVERHEAD
+        + get_string_size(record["recordId"])
+        + get_string_size("Dropped")
+    )
+
+
+def get_response_size(processed_records, record_ids_to_delete):
+    separators_size = RECORD_SEPARATOR_SIZE * max(len(processed_records) - 1, 0)
+    records_size = sum(
+        get_dropped_record_size(record)
+        if record["recordId"] in record_ids_to_delete or "data" not in record
+        else get_kept_record_size(record)
+        for record in processed_records
+    )
+    return RESPONSE_OVERHEAD + separators_size + records_size
+
+
+def get_record_ids_to_delete(processed_records):
+    # Every record costs at least its Dropped entry. Keeping its data costs the
+    # difference on top, so keep the records with the largest differences that
+    # fit. This keeps as much data as possible in the response and sends as
+    # little as possible back through Firehose.
+    dropped_size = get_response_size(
+        processed_records, {record["recordId"] for record in processed_records}
+    )
+    remaining_size = MAX_LAMBDA_RETURN_SIZE - dropped_size
+
+    size_to_keep = {
+        record["recordId"]: get_kept_record_size(record)
+        - get_dropped_record_size(record)
+        for record in processed_records
+        if "data" in record
+    }
+
+    # Failed records are returned as they are, as reingesting them would only
+    # fail again, so their size is reserved before choosing what to keep.
+    for record in processed_records:
+        if record["result"] == "ProcessingFailed":
+            remaining_size -= size_to_keep.pop(record["recordId"])
+
+    if sum(size_to_keep.values()) <= remaining_size:
+        return set()
+
+    record_ids_to_delete = set()
+
+    for record_id in sorted(size_to_keep, key=size_to_keep.get, reverse=True):
+        if size_to_keep[record_id] <= remaining_size:
+            remaining_size -= size_to_keep[record_id]
+        else:
+            record_ids_to_delete.add(record_id)
+
+    return record_ids_to_delete
 
 
 def get_records_to_reingest(processed_records):
-    projected_size = 0
     records_to_reingest = []
     record_ids_to_delete = []
 
-    for record in processed_records:
-        projected_size += len(record["data"]) + len(record["recordId"])
+    ids_to_delete = get_record_ids_to_delete(processed_records)
 
-        if projected_size > MAX_LAMBDA_RETURN_SIZE:
+    for record in processed_records:
+        if record["recordId"] in ids_to_delete:
             record_to_reingest, record_id_to_delete = get_record_to_reingest(record)
             record_ids_to_delete.append(record_id_to_delete)
-            records_to_reingest.append(record_to_reingest)
+            records_to_reingest.extend(record_to_reingest)
 
     return records_to_reingest, record_ids_to_delete
 
 
+def get_untransformed_records_to_reingest(records, processed_records):
+    # Records that were dropped without being transformed are sent back with
+    # their original gzipped data, which is within the Firehose record limit
+    # as it was accepted by the stream.
+    untransformed_record_ids = {
+        record["recordId"] for record in processed_records if "data" not in record
+    }
+
+    return [
+        {"Data": base64.b64decode(record["data"])}
+        for record in records
+        if record["recordId"] in untransformed_record_ids
+    ]
+
+
 def get_record_to_reingest(record):
     formatted_record = format_record_for_firehose(record)
     record_to_reingest = create_batches_from_record(formatted_record)
@@ -33,39 +138,14 @@ def format_record_for_firehose(record_to_reingest):
 
 
 def create_batches_from_record(record):
-    processed_batches = []
-
-    events_with_final_newline = record["Data"].split("\n")
-    events_as_strings = events_with_final_newline[:-1]
-    events_to_ingest = [json.loads(event) for event in events_as_strings]
-
-    remaining_size = len(events_to_ingest)
-    batch_start_offset = 0
-
-    while remaining_size > MAX_BATCH_LENGTH:
-        batch_data = events_to_ingest[batch_start_offset:]
-
-        batch = create_batch(
-            batch_data,
-            MAX_BATCH_LENGTH,
-        )
-
-        processed_batches.append(batch)
-        batch_start_offset += MAX_BATCH_LENGTH
-        remaining_size -= MAX_BATCH_LENGTH
-
-    remaining_events = events_to_ingest[batch_start_offset:]
-    final_batch = create_batch(remaining_events, remaining_size)
-
-    processed_batches.append(final_batch)
-
-    return processed_batches
-
-
-def create_batch(events, upper_limit):
-    batch_data = json.dumps(events[:upper_limit])
-    zip_data = gzip.compress(batch_data.encode())
-    return {"Data": zip_data}
+    # Lines are packed by size without being parsed, and every batch keeps its
+    # newline-delimited framing so process_records can split it again.
+    data = record["Data"].encode()
+
+    return [
+        {"Data": gzip.compress(chunk)}
+        for chunk in split_lines_into_chunks(data, MAX_REINGEST_RECORD_SIZE)
+    ]
 
 
 def delete_records_to_be_reingested(processed_records, record_ids_to_delete):
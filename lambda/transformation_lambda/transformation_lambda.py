@@ -1,27 +1,82 @@
 import base64
 import gzip
 import os
-import boto3
 import io
-import json
 import re
-from transformation_lambda.constants import MAX_REINGESTION_ATTEMPTS
+import time
+import zlib
+from dataclasses import dataclass
+from functools import partial
+from transformation_lambda.parallel import get_parallel_processes, map_in_processes
+from transformation_lambda.constants import (
+    DEFAULT_DEADLINE_MARGIN_MS,
+    FAIL_RECORD,
+    MAX_QUARANTINED_LINE_LENGTH,
+    WRAP_RAW,
+)
 from transformation_lambda.reingest import (
     get_records_to_reingest,
+    get_untransformed_records_to_reingest,
     delete_records_to_be_reingested,
 )
-from utils.utils import put_records_to_firehose_stream
-
-
-def transform_log_event(log_event):
-    return_event = {}
-    return_event["host"] = os.environ["splunk_host"]
-    return_event["index"] = os.environ["splunk_index"]
-    return_event["source"] = os.environ["splunk_source"]
-    return_event["sourcetype"] = os.environ["splunk_sourcetype"]
-    return_event["time"] = log_event[os.environ["timestamp_key"]]
-    return_event["event"] = log_event
-    return f"{json.dumps(return_event)}\n"
+from utils import json_codec, metrics, profiling
+from utils.cache import cached, get_client, get_or_create
+from utils.firehose_batch_writer import FirehoseBatchWriter
+from utils.utils import is_deadline_near
+
+# Reingested events are written by the reingestion Lambda with sourcetype as
+# their first key, so a line starting with one of these is already a HEC event.
+PROCESSED_EVENT_PREFIXES = ('{"sourcetype": "', '{"sourcetype":"')
+REGION_PATTERN = re.compile(r":(\w+-\w+-\w+):")
+STREAM_NAME_PATTERN = re.compile(r"\/(.+)$")
+# Only errors caused by the data are quarantined. Anything else, such as a
+# missing environment variable, fails the invocation. Decoding and JSON errors
+# are ValueErrors, and the stdlib raises RecursionError for deeply nested JSON.
+INVALID_LINE_ERRORS = (ValueError, RecursionError)
+INVALID_RECORD_ERRORS = (ValueError, OSError, EOFError, zlib.error)
+
+
+@dataclass
+class HecEnvelope:
+    prefix: str
+    event_key: str
+    timestamp_key: str
+    compact_json: bool
+
+
+def create_hec_envelope():
+    compact_json = os.environ.get("compact_json", "false").lower() == "true"
+    item_separator, key_separator = (",", ":") if compact_json else (", ", ": ")
+    metadata = {
+        "host": os.environ["splunk_host"],
+        "index": os.environ["splunk_index"],
+        "source": os.environ["splunk_source"],
+        "sourcetype": os.environ["splunk_sourcetype"],
+    }
+
+    # The constant metadata is serialised once, leaving the object open so that
+    # only the time and event need to be serialised for each log event.
+    metadata_json = json_codec.dumps(metadata, compact_json)
+    prefix = f'{metadata_json[:-1]}{item_separator}"time"{key_separator}'
+    event_key = f'{item_separator}"event"{key_separator}'
+
+    return HecEnvelope(prefix, event_key, os.environ["timestamp_key"], compact_json)
+
+
+def get_hec_envelope():
+    return get_or_create("hec_envelope", create_hec_envelope)
+
+
+def transform_log_event(log_event, envelope=None):
+    if envelope is None:
+        envelope = get_hec_envelope()
+    try:
+        timestamp = log_event[envelope.timestamp_key]
+    except KeyError:
+        raise ValueError(f"Log event has no {envelope.timestamp_key} field")
+    time = json_codec.dumps(timestamp, envelope.compact_json)
+    event = json_codec.dumps(log_event, envelope.compact_json)
+    return f"{envelope.prefix}{time}{envelope.event_key}{event}}}\n"
 
 
 def encode_record_data(original_record):
@@ -33,99 +88,248 @@ def encode_record_data(original_record):
 
     original_data = original_record["data"]
 
+    # Failed records are returned with their original data, which is already
+    # base64 encoded.
+    if result == "ProcessingFailed":
+        metrics.add("OutputBytes", len(original_data), metrics.BYTES)
+        return {"data": original_data, "recordId": record_id, "result": result}
+
     # convert string to base64 encoded string for firehose.
     # b64encode requires bytes as input, so we need to encode the string first.
     # b64encode returns bytes, so we need to decode it back to a string.
     encoded_data = base64.b64encode(original_data.encode()).decode()
+    metrics.add("OutputBytes", len(encoded_data), metrics.BYTES)
     return {"data": encoded_data, "recordId": record_id, "result": result}
 
 
-def process_event(event):
+def process_event(event, envelope=None):
+    if not isinstance(event, dict):
+        raise ValueError(f"Log event is a {type(event).__name__}, not an object")
+
     event_is_not_already_processed = event.get("sourcetype") == None
 
     if event_is_not_already_processed:
-        processed_event = transform_log_event(event)
+        processed_event = transform_log_event(event, envelope)
     else:
-        processed_event = json.dumps(event)
+        processed_event = f"{json_codec.dumps(event)}\n"
 
     return processed_event
 
 
-def process_records(records):
-    processed_records = []
+def is_already_processed(line, envelope=None):
+    if envelope is None:
+        envelope = get_hec_envelope()
+    return line.startswith(PROCESSED_EVENT_PREFIXES) or line.startswith(envelope.prefix)
 
-    for record in records:
-        decoded_data = base64.b64decode(record["data"])
-        io_data = io.BytesIO(decoded_data)
 
-        with gzip.GzipFile(fileobj=io_data, mode="r") as unzipped_file:
-            data = unzipped_file.read().decode()
+def process_line(line, envelope=None):
+    if envelope is None:
+        envelope = get_hec_envelope()
+    if is_already_processed(line, envelope):
+        return f"{line}\n"
 
-        events_as_strings = data.split("\n")
+    return process_event(json_codec.loads(line), envelope)
 
-        last_event_is_empty = events_as_strings[-1] == ""
 
-        if last_event_is_empty:
-            events_as_strings = events_as_strings[:-1]
+def iter_record_lines(record):
+    with metrics.timer("Base64DecodeTime"):
+        decoded_data = base64.b64decode(record["data"])
+    metrics.add("InputBytes", len(decoded_data), metrics.BYTES)
+
+    # Iterating the GzipFile decompresses incrementally, so only the line being
+    # processed is held in memory rather than the whole decompressed record.
+    # Decompression is interleaved with the lines' processing, so its time is
+    # only counted as part of TransformTime.
+    with gzip.GzipFile(fileobj=io.BytesIO(decoded_data), mode="r") as unzipped_file:
+        for line in unzipped_file:
+            line = line.rstrip(b"\n")
+            if line:
+                yield line
+
+        metrics.add("DecompressedBytes", unzipped_file.tell(), metrics.BYTES)
+
+
+def get_invalid_line_mode():
+    invalid_line_mode = os.environ.get("invalid_line_mode", FAIL_RECORD)
+    if invalid_line_mode not in (FAIL_RECORD, WRAP_RAW):
+        raise ValueError(f"Unknown invalid_line_mode: {invalid_line_mode}")
+    return invalid_line_mode
+
+
+def wrap_invalid_line(line, envelope=None):
+    if envelope is None:
+        envelope = get_hec_envelope()
+    event = json_codec.dumps(line, envelope.compact_json)
+    return f"{envelope.prefix}{int(time.time())}{envelope.event_key}{event}}}\n"
+
+
+def quarantine_line(record_id, line_number, line, error):
+    return {
+        "recordId": record_id,
+        "lineNumber": line_number,
+        "error": repr(error),
+        "line": line[:MAX_QUARANTINED_LINE_LENGTH],
+    }
+
+
+def process_record(record, invalid_line_mode):
+    record_id = record["recordId"]
+    processed_lines = []
+    invalid_lines = []
+    envelope = get_hec_envelope()
+
+    try:
+        for line_number, raw_line in enumerate(iter_record_lines(record)):
+            # Lines are decoded one at a time, so a line that is not valid
+            # UTF-8 is handled like any other invalid line.
+            try:
+                processed_lines.append(process_line(raw_line.decode(), envelope))
+            except INVALID_LINE_ERRORS as e:
+                line = raw_line.decode(errors="replace")
+                invalid_lines.append(quarantine_line(record_id, line_number, line, e))
+                if invalid_line_mode == WRAP_RAW:
+                    processed_lines.append(wrap_invalid_line(line, envelope))
+    except INVALID_RECORD_ERRORS as e:
+        # The record itself could not be decoded, so no line can be saved.
+        invalid_lines.append(quarantine_line(record_id, None, "", e))
+        invalid_line_mode = FAIL_RECORD
+
+    if invalid_lines and invalid_line_mode == FAIL_RECORD:
+        # Firehose writes failed records to the splashback bucket with the
+        # original data, which is already base64 encoded.
+        metrics.add("RecordsFailed", 1)
+        return {
+            "data": record["data"],
+            "result": "ProcessingFailed",
+            "recordId": record_id,
+            "invalidLines": invalid_lines,
+        }
 
-        events = [json.loads(event) for event in events_as_strings]
+    metrics.add("Events", len(processed_lines))
+    processed_record = {
+        "data": "".join(processed_lines),
+        "result": "Ok",
+        "recordId": record_id,
+    }
+    if invalid_lines:
+        processed_record["invalidLines"] = invalid_lines
 
-        record_id = record["recordId"]
-        processed_data = ""
+    return processed_record
 
-        for event in events:
-            processed_event = process_event(event)
-            processed_data = f"{processed_data}{processed_event}"
 
-        processed_record = {
-            "data": processed_data,
-            "result": "Ok",
-            "recordId": record_id,
-        }
+def process_records(records, deadline_reached=None):
+    processed_records = []
+    invalid_line_mode = get_or_create("invalid_line_mode", get_invalid_line_mode)
 
-        processed_records.append(processed_record)
+    for record in records:
+        # Once the deadline is near the remaining records are dropped from the
+        # response and sent back to the stream untransformed instead.
+        if deadline_reached is not None and deadline_reached():
+            processed_records.append(
+                {"result": "Dropped", "recordId": record["recordId"]}
+            )
+            continue
+
+        processed_records.append(process_record(record, invalid_line_mode))
 
     return processed_records
 
 
+def log_invalid_lines(processed_records):
+    invalid_lines = [
+        invalid_line
+        for record in processed_records
+        for invalid_line in record.get("invalidLines", [])
+    ]
+
+    if not invalid_lines:
+        return
+
+    metrics.add("InvalidLines", len(invalid_lines))
+    print(f"Quarantined {len(invalid_lines)} invalid lines")
+    for invalid_line in invalid_lines:
+        print(f"Quarantined line: {json_codec.dumps(invalid_line)}")
+
+
+@cached
 def get_region_from_arn(stream_arn):
-    return re.search(r":(\w+-\w+-\w+):", stream_arn).group(1)
+    return REGION_PATTERN.search(stream_arn).group(1)
 
 
+@cached
 def get_stream_name_from_arn(stream_arn):
-    return re.search(r"\/(.+)$", stream_arn).group(1)
+    return STREAM_NAME_PATTERN.search(stream_arn).group(1)
+
+
+def get_deadline_margin_ms():
+    try:
+        deadline_margin_ms = int(os.environ["deadline_margin_ms"])
+    except Exception:
+        deadline_margin_ms = DEFAULT_DEADLINE_MARGIN_MS
+    return deadline_margin_ms
 
 
-def lambda_handler(event, _context):
+@profiling.profiled
+@metrics.invocation("transformation_lambda")
+def lambda_handler(event, context):
     print(f"Received {len(event['records'])} records")
+    metrics.add("Records", len(event["records"]))
     stream_arn = event["deliveryStreamArn"]
     stream_name = get_stream_name_from_arn(stream_arn)
     region = get_region_from_arn(stream_arn)
 
-    processed_records = process_records(event["records"])
+    parallel_processes = get_or_create("parallel_processes", get_parallel_processes)
+    deadline_reached = partial(
+        is_deadline_near,
+        context,
+        get_or_create("deadline_margin_ms", get_deadline_margin_ms),
+    )
+    process = partial(process_records, deadline_reached=deadline_reached)
+
+    with metrics.timer("TransformTime"):
+        if parallel_processes > 1 and len(event["records"]) > 1:
+            processed_records = map_in_processes(
+                process, event["records"], parallel_processes
+            )
+        else:
+            processed_records = process(event["records"])
 
-    records_to_reingest, record_ids_to_delete = get_records_to_reingest(
-        processed_records
+    log_invalid_lines(processed_records)
+
+    untransformed_records = get_untransformed_records_to_reingest(
+        event["records"], processed_records
     )
+    if untransformed_records:
+        print(
+            f"Deadline near, {len(untransformed_records)} records reingested untransformed"
+        )
 
-    if records_to_reingest:
-        client = boto3.client("firehose", region_name=region)
-        put_records_to_firehose_stream(
-            stream_name,
-            records_to_reingest,
-            client,
-            attempts_made=0,
-            max_attempts=MAX_REINGESTION_ATTEMPTS,
+    with metrics.timer("SizePlanningTime"):
+        records_to_reingest, record_ids_to_delete = get_records_to_reingest(
+            processed_records
         )
+    records_to_reingest = untransformed_records + records_to_reingest
+
+    if records_to_reingest:
+        client = get_client("firehose", region)
+        with FirehoseBatchWriter(stream_name, client) as writer:
+            writer.put_records(records_to_reingest)
 
         processed_records = delete_records_to_be_reingested(
             processed_records, record_ids_to_delete
         )
 
-    encoded_records = [encode_record_data(record) for record in processed_records]
+    with metrics.timer("EncodeTime"):
+        encoded_records = [encode_record_data(record) for record in processed_records]
 
-    record_return_count = len(encoded_records) - len(records_to_reingest)
+    reingested_count = len(record_ids_to_delete) + len(untransformed_records)
+    record_return_count = len(encoded_records) - reingested_count
     print(
-        f"{record_return_count} batches returned by handler, {len(records_to_reingest)} batches reingested"
+        f"{record_return_count} batches returned by handler, {reingested_count} batches reingested"
     )
+    metrics.add("RecordsReturned", record_return_count)
+    metrics.add("RecordsReingested", reingested_count)
+    metrics.add("RecordsReingestedUntransformed", len(untransformed_records))
+    metrics.add_ratio("EventsPerRecord", "Events", "Records")
+    metrics.add_ratio("CompressionRatio", "DecompressedBytes", "InputBytes")
     return {"records": encoded_records}
@@ -0,0 +1,49 @@
+import threading
+from functools import wraps
+import boto3
+from botocore.config import Config
+
+
+# Values stored here live for as long as the Lambda container stays warm, so
+# clients keep their connection pools between invocations.
+CLIENT_MAX_POOL_CONNECTIONS = 50
+
+_cache = {}
+_lock = threading.RLock()
+
+
+def get_or_create(key, factory):
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+
+    with _lock:
+        if key not in _cache:
+            _cache[key] = factory()
+        return _cache[key]
+
+
+def get_client(service_name, region_name=None):
+    def create_client():
+        return boto3.client(
+            service_name,
+            region_name=region_name,
+            config=Config(max_pool_connections=CLIENT_MAX_POOL_CONNECTIONS),
+        )
+
+    return get_or_create(("client", service_name, region_name), create_client)
+
+
+def cached(function):
+    @wraps(function)
+    def wrapper(*args):
+        key = (function.__module__, function.__qualname__, *args)
+        return get_or_create(key, lambda: function(*args))
+
+    return wrapper
+
+
+def reset():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,13 @@
+FIREHOSE_MAX_RECORD_SIZE = 1024000
+FIREHOSE_MAX_BATCH_RECORDS = 500
+FIREHOSE_MAX_BATCH_SIZE = 4194304
+FIREHOSE_RETRY_BASE_DELAY = 0.05
+FIREHOSE_RETRY_MAX_DELAY = 2.0
+FIREHOSE_MAX_ATTEMPTS = 20
+# Errors from a whole PutRecordBatch call that are worth retrying. Any other
+# ClientError, such as InvalidArgumentException, fails the same way every time.
+FIREHOSE_RETRYABLE_ERROR_CODES = {
+    "ServiceUnavailableException",
+    "ThrottlingException",
+    "Throttling",
+}
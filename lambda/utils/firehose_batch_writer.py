@@ -0,0 +1,141 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils.constants import (
+    FIREHOSE_MAX_ATTEMPTS,
+    FIREHOSE_MAX_BATCH_RECORDS,
+    FIREHOSE_MAX_BATCH_SIZE,
+)
+from utils import metrics
+from utils.utils import FirehosePutResult, put_records_to_firehose_stream
+
+
+DEFAULT_MAX_IN_FLIGHT_BATCHES = 4
+
+
+def get_max_in_flight_batches():
+    try:
+        max_in_flight_batches = int(os.environ["max_in_flight_batches"])
+    except Exception:
+        max_in_flight_batches = DEFAULT_MAX_IN_FLIGHT_BATCHES
+    return max(max_in_flight_batches, 1)
+
+
+class FirehoseBatchWriter:
+    def __init__(
+        self,
+        stream_name,
+        client,
+        max_attempts=FIREHOSE_MAX_ATTEMPTS,
+        max_batch_records=FIREHOSE_MAX_BATCH_RECORDS,
+        max_batch_size=FIREHOSE_MAX_BATCH_SIZE,
+        max_in_flight=1,
+    ):
+        self.stream_name = stream_name
+        self.client = client
+        self.max_attempts = max_attempts
+        self.max_batch_records = max_batch_records
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self.result = FirehosePutResult()
+        self.batch = []
+        self.batch_size = 0
+        self.executor = None
+        self.in_flight = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Records are only flushed on a clean exit, an error while producing
+        # them leaves the remainder unsent so the caller's retry can resend it.
+        # Batches already submitted are always waited for.
+        try:
+            if exc_type is None:
+                self.flush()
+                self.wait_for_in_flight(0)
+            else:
+                self.wait_for_in_flight_after_error()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+        return False
+
+    def put(self, record):
+        record_size = len(record["Data"])
+
+        if self.batch and self.batch_size + record_size > self.max_batch_size:
+            self.flush()
+
+        self.batch.append(record)
+        self.batch_size += record_size
+
+        if len(self.batch) >= self.max_batch_records:
+            self.flush()
+
+    def put_records(self, records):
+        for record in records:
+            self.put(record)
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        batch = self.batch
+        self.batch = []
+        self.batch_size = 0
+
+        if self.max_in_flight <= 1:
+            self.add_result(self.send_batch(batch))
+            return
+
+        # Block the producer while the in-flight limit is reached, so memory
+        # held by unsent batches stays bounded.
+        self.wait_for_in_flight(self.max_in_flight - 1)
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self.in_flight.add(self.executor.submit(self.send_batch, batch))
+
+    def send_batch(self, batch):
+        with metrics.timer("FirehosePutTime"):
+            return put_records_to_firehose_stream(
+                self.stream_name,
+                batch,
+                self.client,
+                attempts_made=0,
+                max_attempts=self.max_attempts,
+            )
+
+    def wait_for_in_flight(self, max_remaining):
+        errors = []
+
+        # After a failed send the rest are waited for too, so none is still
+        # running when the error reaches the handler.
+        while len(self.in_flight) > max_remaining or (errors and self.in_flight):
+            done, self.in_flight = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    self.add_result(future.result())
+                except Exception as e:
+                    errors.append(e)
+
+        if errors:
+            raise errors[0]
+
+    def wait_for_in_flight_after_error(self):
+        # The producer's error is the one re-raised, a failed send is logged.
+        try:
+            self.wait_for_in_flight(0)
+        except Exception as e:
+            print(f"PutRecordBatch also failed while closing the writer: {e}")
+
+    def add_result(self, batch_result):
+        self.result.records_sent += batch_result.records_sent
+        self.result.batches_sent += batch_result.batches_sent
+        self.result.attempts += batch_result.attempts
+        self.result.delays.extend(batch_result.delays)
+        for code, count in batch_result.failure_counts.items():
+            self.result.failure_counts[code] = (
+                self.result.failure_counts.get(code, 0) + count
+            )
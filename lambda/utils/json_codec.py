@@ -0,0 +1,141 @@
+import json
+import os
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+COMPACT_SEPARATORS = (",", ":")
+# orjson decodes integers wider than 64 bits as floats, and those need at least
+# 19 digits. A longer run of digits inside a string or a float only costs an
+# unneeded fallback.
+LONG_NUMBER_PATTERN = re.compile(r"\d{19}")
+LONG_NUMBER_BYTES_PATTERN = re.compile(rb"\d{19}")
+
+
+# orjson writes NaN and Infinity as null, and it refuses to serialise float
+# subclasses, so decoding them as this type sends those events to the stdlib
+# encoder without having to search the output.
+class NonFiniteFloat(float):
+    pass
+
+
+NON_FINITE_FLOATS = {
+    "NaN": NonFiniteFloat("nan"),
+    "Infinity": NonFiniteFloat("inf"),
+    "-Infinity": NonFiniteFloat("-inf"),
+}
+
+
+class StdlibBackend:
+    name = "stdlib"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps_compact(self, obj):
+        output = json.dumps(obj, separators=COMPACT_SEPARATORS, ensure_ascii=False)
+        if output.isascii():
+            return output
+        try:
+            output.encode()
+        except UnicodeEncodeError:
+            # A lone surrogate cannot be written as UTF-8, so it is escaped.
+            return json.dumps(obj, separators=COMPACT_SEPARATORS)
+        return output
+
+    def dumpb_compact(self, obj):
+        return self.dumps_compact(obj).encode()
+
+
+class OrjsonBackend:
+    name = "orjson"
+
+    def loads(self, data):
+        # Anything orjson rejects or could decode differently, such as NaN,
+        # Infinity, lone surrogates and wide integers, is left to the stdlib so
+        # the result is the same whichever backend is installed.
+        pattern = (
+            LONG_NUMBER_BYTES_PATTERN
+            if isinstance(data, (bytes, bytearray))
+            else LONG_NUMBER_PATTERN
+        )
+        if pattern.search(data):
+            return self.loads_with_stdlib(data)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return self.loads_with_stdlib(data)
+
+    def loads_with_stdlib(self, data):
+        return json.loads(data, parse_constant=NON_FINITE_FLOATS.__getitem__)
+
+    def dumps_compact(self, obj):
+        output = self.encode(obj)
+        if output is None:
+            return StdlibBackend().dumps_compact(obj)
+        return output.decode()
+
+    def dumpb_compact(self, obj):
+        output = self.encode(obj)
+        if output is None:
+            return StdlibBackend().dumpb_compact(obj)
+        return output
+
+    def encode(self, obj):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson rejects integers wider than 64 bits, non-string keys, lone
+            # surrogates and the non-finite floats decoded by loads.
+            return None
+
+
+def create_backend(name):
+    if name == "stdlib":
+        return StdlibBackend()
+    if name == "orjson":
+        if orjson is None:
+            raise ImportError("orjson is not installed.")
+        return OrjsonBackend()
+    if name == "auto":
+        return OrjsonBackend() if orjson is not None else StdlibBackend()
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+
+_backend = create_backend(os.environ.get("json_backend", "auto"))
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(name):
+    global _backend
+    _backend = create_backend(name)
+    return _backend
+
+
+def loads(data):
+    return _backend.loads(data)
+
+
+def dumps(obj, compact=False, default=None):
+    # The default layout is always produced by the stdlib so that the output
+    # stays byte for byte identical whichever backend is installed.
+    if not compact:
+        return json.dumps(obj, default=default)
+    if default is None:
+        return _backend.dumps_compact(obj)
+    return json.dumps(
+        obj, separators=COMPACT_SEPARATORS, ensure_ascii=False, default=default
+    )
+
+
+def dumpb(obj, compact=False):
+    if compact:
+        return _backend.dumpb_compact(obj)
+    return json.dumps(obj).encode()
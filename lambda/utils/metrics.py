@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from utils import json_codec
+
+
+DEFAULT_NAMESPACE = "S3ToSplunkUpload"
+COUNT = "Count"
+BYTES = "Bytes"
+MILLISECONDS = "Milliseconds"
+NONE = "None"
+
+
+class Metrics:
+    def __init__(self, namespace, function_name):
+        self.namespace = namespace
+        self.function_name = function_name
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, value, unit=COUNT):
+        with self.lock:
+            current_value, _ = self.values.get(name, (0, unit))
+            self.values[name] = (current_value + value, unit)
+
+    def set(self, name, value, unit=COUNT):
+        with self.lock:
+            self.values[name] = (value, unit)
+
+    def get(self, name):
+        return self.values.get(name, (0, None))[0]
+
+    def add_ratio(self, name, numerator_name, denominator_name):
+        denominator = self.get(denominator_name)
+        if denominator:
+            self.set(name, self.get(numerator_name) / denominator, NONE)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000, MILLISECONDS)
+
+    def take_values(self):
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        for name, (value, unit) in values.items():
+            self.add(name, value, unit)
+
+    def to_emf(self):
+        values = dict(sorted(self.values.items()))
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["FunctionName"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in values.items()
+                        ],
+                    }
+                ],
+            },
+            "FunctionName": self.function_name,
+            **{name: value for name, (value, _) in values.items()},
+        }
+
+    def flush(self):
+        if self.values:
+            # CloudWatch extracts the metrics from this log line, no API call
+            # is made from the function.
+            print(json_codec.dumps(self.to_emf(), compact=True))
+        self.values = {}
+
+
+class NullMetrics:
+    def add(self, name, value, unit=COUNT):
+        pass
+
+    def set(self, name, value, unit=COUNT):
+        pass
+
+    def get(self, name):
+        return 0
+
+    def add_ratio(self, name, numerator_name, denominator_name):
+        pass
+
+    def timer(self, name):
+        return nullcontext()
+
+    def take_values(self):
+        return {}
+
+    def merge(self, values):
+        pass
+
+    def flush(self):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+_current = NULL_METRICS
+
+
+def metrics_are_enabled():
+    return os.environ.get("metrics_enabled", "false").lower() == "true"
+
+
+def create_metrics(function_name):
+    if not metrics_are_enabled():
+        return NULL_METRICS
+
+    namespace = os.environ.get("metrics_namespace", DEFAULT_NAMESPACE)
+    function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", function_name)
+    return Metrics(namespace, function_name)
+
+
+# Used as a decorator on a handler, the metrics recorded while it runs are
+# printed as one EMF log line when it returns or raises.
+@contextmanager
+def invocation(function_name):
+    global _current
+    _current = create_metrics(function_name)
+    try:
+        yield _current
+    finally:
+        _current.flush()
+        _current = NULL_METRICS
+
+
+def get_metrics():
+    return _current
+
+
+def add(name, value, unit=COUNT):
+    _current.add(name, value, unit)
+
+
+def set(name, value, unit=COUNT):
+    _current.set(name, value, unit)
+
+
+def add_ratio(name, numerator_name, denominator_name):
+    _current.add_ratio(name, numerator_name, denominator_name)
+
+
+def timer(name):
+    return _current.timer(name)
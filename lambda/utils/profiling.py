@@ -0,0 +1,122 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+from functools import wraps
+from utils.cache import get_or_create
+
+
+CPU = "cpu"
+MEMORY = "memory"
+CPU_AND_MEMORY = "cpu_and_memory"
+DEFAULT_PROFILE_TOP_N = 25
+
+
+@dataclass
+class ProfilingSettings:
+    sample_rate: float = 0.0
+    mode: str = CPU
+    top_n: int = DEFAULT_PROFILE_TOP_N
+    output_dir: str = None
+
+
+def get_profiling_settings():
+    try:
+        sample_rate = float(os.environ["profile_sample_rate"])
+    except Exception:
+        sample_rate = 0.0
+    try:
+        top_n = int(os.environ["profile_top_n"])
+    except Exception:
+        top_n = DEFAULT_PROFILE_TOP_N
+
+    mode = os.environ.get("profile_mode", CPU)
+    if mode not in (CPU, MEMORY, CPU_AND_MEMORY):
+        raise ValueError(f"Unknown profile_mode: {mode}")
+
+    return ProfilingSettings(
+        sample_rate, mode, top_n, os.environ.get("profile_output_dir") or None
+    )
+
+
+def is_sampled(settings, random_function=random.random):
+    return settings.sample_rate > 0 and random_function() < settings.sample_rate
+
+
+def get_profile_name(handler, context):
+    request_id = getattr(context, "aws_request_id", None) or int(time.time() * 1000)
+    return f"{handler.__module__.rsplit('.', 1)[-1]}-{request_id}"
+
+
+def format_cpu_profile(profiler, top_n):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(top_n)
+    return stream.getvalue()
+
+
+def format_memory_profile(snapshot, peak_size, top_n):
+    lines = [f"Peak traced memory: {peak_size} bytes"]
+    lines.extend(str(statistic) for statistic in snapshot.statistics("lineno")[:top_n])
+    return "\n".join(lines)
+
+
+def write_report(profile_name, report, output_dir):
+    if output_dir is None:
+        print(f"Profile of {profile_name}:\n{report}")
+        return
+
+    report_path = os.path.join(output_dir, f"{profile_name}.txt")
+    with open(report_path, "w") as report_file:
+        report_file.write(report)
+    print(f"Profile of {profile_name} written to {report_path}")
+
+
+def run_profiled(handler, settings, event, context):
+    profile_name = get_profile_name(handler, context)
+    # cProfile only sees the calling thread, so time spent in worker threads
+    # and forked processes shows up as the wait for their results.
+    profiler = cProfile.Profile() if settings.mode != MEMORY else None
+    # Tracing allocations slows every allocation down, which inflates the CPU
+    # profile of a cpu_and_memory run.
+    trace_memory = settings.mode != CPU and not tracemalloc.is_tracing()
+
+    if trace_memory:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        return handler(event, context)
+    finally:
+        reports = []
+
+        if profiler is not None:
+            profiler.disable()
+            reports.append(format_cpu_profile(profiler, settings.top_n))
+            if settings.output_dir is not None:
+                profiler.dump_stats(
+                    os.path.join(settings.output_dir, f"{profile_name}.prof")
+                )
+
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak_size = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            reports.append(format_memory_profile(snapshot, peak_size, settings.top_n))
+
+        write_report(profile_name, "\n".join(reports), settings.output_dir)
+
+
+def profiled(handler):
+    @wraps(handler)
+    def wrapper(event, context):
+        settings = get_or_create("profiling_settings", get_profiling_settings)
+        if not is_sampled(settings):
+            return handler(event, context)
+        return run_profiled(handler, settings, event, context)
+
+    return wrapper
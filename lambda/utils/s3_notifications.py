@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import unquote_plus
+
+
+DEFAULT_MAX_CONCURRENT_OBJECTS = 10
+
+
+@dataclass
+class S3ObjectResult:
+    bucket_name: str
+    key: str
+    response: Any = None
+    error: Exception = None
+
+
+def get_bucket_name_and_key(notification_record):
+    bucket_name = notification_record["s3"]["bucket"]["name"]
+    object_key = unquote_plus(
+        notification_record["s3"]["object"]["key"], encoding="utf-8"
+    )
+    return bucket_name, object_key
+
+
+def get_s3_objects_from_event(event):
+    return [get_bucket_name_and_key(record) for record in event["Records"]]
+
+
+def get_max_concurrent_objects():
+    try:
+        max_concurrent_objects = int(os.environ["max_concurrent_objects"])
+    except Exception:
+        max_concurrent_objects = DEFAULT_MAX_CONCURRENT_OBJECTS
+    return max(max_concurrent_objects, 1)
+
+
+def process_s3_objects(s3_objects, process_object, max_workers):
+    def process(s3_object):
+        bucket_name, key = s3_object
+        try:
+            response = process_object(bucket_name, key)
+        except Exception as e:
+            return S3ObjectResult(bucket_name, key, error=e)
+        return S3ObjectResult(bucket_name, key, response=response)
+
+    if len(s3_objects) <= 1:
+        return [process(s3_object) for s3_object in s3_objects]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(s3_objects))) as pool:
+        return list(pool.map(process, s3_objects))
+
+
+def raise_for_failed_objects(results):
+    failed_results = [result for result in results if result.error is not None]
+
+    print(f"Processed {len(results) - len(failed_results)} of {len(results)} objects")
+
+    for result in failed_results:
+        print(
+            f"Failed to process s3://{result.bucket_name}/{result.key}: {result.error}"
+        )
+
+    if failed_results:
+        raise failed_results[0].error
@@ -1,39 +1,220 @@
-def put_records_to_firehose_stream(
-    stream_name, records, client, attempts_made, max_attempts
-):
-    failed_records = []
-    codes = []
-    err_msg = ""
-    firehose_response = None
+import io
+import random
+import time
+from dataclasses import dataclass, field
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectionError,
+    ReadTimeoutError,
+)
+from utils import metrics
+from utils.constants import (
+    FIREHOSE_MAX_BATCH_RECORDS,
+    FIREHOSE_MAX_BATCH_SIZE,
+    FIREHOSE_RETRY_BASE_DELAY,
+    FIREHOSE_RETRY_MAX_DELAY,
+    FIREHOSE_RETRYABLE_ERROR_CODES,
+)
+
 
+@dataclass
+class FirehosePutResult:
+    records_sent: int = 0
+    batches_sent: int = 0
+    attempts: int = 0
+    delays: list = field(default_factory=list)
+    failure_counts: dict = field(default_factory=dict)
+
+
+def get_error_code(error):
     try:
-        firehose_response = client.put_record_batch(
-            DeliveryStreamName=stream_name, Records=records
-        )
-    except Exception as e:
-        failed_records = records
-        err_msg = str(e)
+        return error.response["Error"]["Code"]
+    except Exception:
+        return type(error).__name__
 
-    if firehose_response and firehose_response["FailedPutCount"] > 0:
-        for idx, event_response in enumerate(firehose_response["RequestResponses"]):
-            if event_response.get("ErrorCode") == None:
-                continue
 
-            codes.append(event_response["ErrorCode"])
-            failed_records.append(records[idx])
+def get_backoff_delay(retry_number, base_delay, max_delay, random_function):
+    # Full jitter: a random delay up to an exponentially growing cap spreads
+    # retries from concurrent senders instead of retrying them in lockstep.
+    return random_function() * min(max_delay, base_delay * 2**retry_number)
 
-        codes_string = ", ".join(codes)
-        err_msg = f"Individual error codes: {codes_string}"
 
-    if len(failed_records) > 0:
-        if attempts_made + 1 < max_attempts:
-            print(
-                f"Some records failed while calling PutRecordBatch to Firehose stream, retrying. {err_msg}"
-            )
-            put_records_to_firehose_stream(
-                stream_name, failed_records, client, attempts_made + 1, max_attempts
+def put_batch_to_firehose_stream(
+    stream_name,
+    batch,
+    client,
+    attempts_made,
+    max_attempts,
+    result,
+    sleep,
+    random_function,
+):
+    pending_records = batch
+    retry_number = 0
+
+    while True:
+        failed_records = []
+        codes = []
+        err_msg = ""
+        firehose_response = None
+        result.attempts += 1
+
+        try:
+            firehose_response = client.put_record_batch(
+                DeliveryStreamName=stream_name, Records=pending_records
             )
-        else:
+        except ClientError as e:
+            if get_error_code(e) not in FIREHOSE_RETRYABLE_ERROR_CODES:
+                raise
+            failed_records = pending_records
+            codes = [get_error_code(e)] * len(pending_records)
+            err_msg = str(e)
+        except (ConnectionError, ConnectionClosedError, ReadTimeoutError) as e:
+            # The request may not have reached Firehose, so the batch is sent
+            # again. Any other error, such as invalid parameters, is raised.
+            failed_records = pending_records
+            codes = [get_error_code(e)] * len(pending_records)
+            err_msg = str(e)
+
+        if firehose_response and firehose_response["FailedPutCount"] > 0:
+            for idx, event_response in enumerate(firehose_response["RequestResponses"]):
+                if event_response.get("ErrorCode") == None:
+                    continue
+
+                codes.append(event_response["ErrorCode"])
+                failed_records.append(pending_records[idx])
+
+            codes_string = ", ".join(codes)
+            err_msg = f"Individual error codes: {codes_string}"
+
+        for code in codes:
+            result.failure_counts[code] = result.failure_counts.get(code, 0) + 1
+
+        if len(failed_records) == 0:
+            return
+
+        metrics.add("FirehoseFailedRecords", len(failed_records))
+
+        attempts_made += 1
+        if attempts_made >= max_attempts:
             raise RuntimeError(
                 f"Could not put records after {max_attempts} attempts. {err_msg}"
             )
+
+        delay = get_backoff_delay(
+            retry_number,
+            FIREHOSE_RETRY_BASE_DELAY,
+            FIREHOSE_RETRY_MAX_DELAY,
+            random_function,
+        )
+        print(
+            f"Some records failed while calling PutRecordBatch to Firehose stream, retrying in {delay:.3f}s. {err_msg}"
+        )
+        result.delays.append(delay)
+        metrics.add("FirehoseRetries", 1)
+        sleep(delay)
+
+        pending_records = failed_records
+        retry_number += 1
+
+
+def put_records_to_firehose_stream(
+    stream_name,
+    records,
+    client,
+    attempts_made=0,
+    max_attempts=20,
+    sleep=time.sleep,
+    random_function=random.random,
+):
+    result = FirehosePutResult()
+
+    for batch in split_records_into_batches(records):
+        put_batch_to_firehose_stream(
+            stream_name,
+            batch,
+            client,
+            attempts_made,
+            max_attempts,
+            result,
+            sleep,
+            random_function,
+        )
+        result.records_sent += len(batch)
+        result.batches_sent += 1
+        metrics.add("FirehoseRecordsSent", len(batch))
+        metrics.add("FirehoseBatchesSent", 1)
+
+    return result
+
+
+def split_records_into_batches(records):
+    batch = []
+    batch_size = 0
+
+    for record in records:
+        record_size = len(record["Data"])
+        batch_is_full = len(batch) >= FIREHOSE_MAX_BATCH_RECORDS
+        batch_would_overflow = batch_size + record_size > FIREHOSE_MAX_BATCH_SIZE
+
+        if batch and (batch_is_full or batch_would_overflow):
+            yield batch
+            batch = []
+            batch_size = 0
+
+        batch.append(record)
+        batch_size += record_size
+
+    if batch:
+        yield batch
+
+
+def split_lines_into_chunks(contents, target_size):
+    start = 0
+
+    while len(contents) - start > target_size:
+        # Cut at the last newline that keeps the chunk within the target size.
+        # A single line longer than the target becomes a chunk on its own.
+        end = contents.rfind(b"\n", start, start + target_size)
+
+        if end == -1:
+            end = contents.find(b"\n", start + target_size)
+
+        if end == -1:
+            break
+
+        yield contents[start : end + 1]
+        start = end + 1
+
+    if start < len(contents):
+        yield contents[start:]
+
+
+def iter_lines(object_body, decode=True):
+    # A binary file object, such as a GzipFile wrapping an S3 body stream, is
+    # read one line at a time so the whole body is never held in memory.
+    if isinstance(object_body, str):
+        object_body = io.StringIO(object_body, newline="\n")
+    elif isinstance(object_body, (bytes, bytearray)):
+        object_body = io.BytesIO(object_body)
+
+    for line in object_body:
+        if isinstance(line, bytes):
+            line = line.rstrip(b"\n")
+            if decode:
+                line = line.decode()
+        else:
+            line = line.rstrip("\n")
+        if len(line) == 0:
+            continue
+        yield line
+
+
+def is_deadline_near(context, margin_ms):
+    get_remaining_time_in_millis = getattr(
+        context, "get_remaining_time_in_millis", None
+    )
+    if get_remaining_time_in_millis is None:
+        return False
+    return get_remaining_time_in_millis() < margin_ms
@@ -0,0 +1,16 @@
+resource "aws_dynamodb_table" "reingestion_checkpoints" {
+  count        = var.enable_reingestion_checkpoints ? 1 : 0
+  name         = "audit_logs_reingestion_checkpoints"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "ObjectId"
+
+  attribute {
+    name = "ObjectId"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ExpiresAt"
+    enabled        = true
+  }
+}
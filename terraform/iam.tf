@@ -16,6 +16,7 @@ data "template_file" "audit_logs_lambda_policy_template" {
     audit_logs_bucket_arn            = aws_s3_bucket.audit_logs_bucket.arn
     audit_logs_splashback_bucket_arn = aws_s3_bucket.audit_logs_splashback.arn
     audit_logs_firehose_arn          = aws_kinesis_firehose_delivery_stream.audit_logs_stream.arn
+    audit_logs_lambda_failures_arn   = aws_sqs_queue.lambda_failures.arn
   }
 }
 
@@ -29,6 +30,26 @@ resource "aws_iam_role_policy_attachment" "audit_logs_lambda_iam_policy_attachme
   role       = aws_iam_role.lambda_role.name
 }
 
+data "template_file" "reingestion_checkpoints_policy_template" {
+  count    = var.enable_reingestion_checkpoints ? 1 : 0
+  template = file("${path.module}/policies/reingestion-checkpoints.json")
+  vars = {
+    reingestion_checkpoints_table_arn = aws_dynamodb_table.reingestion_checkpoints[0].arn
+  }
+}
+
+resource "aws_iam_policy" "reingestion_checkpoints_policy" {
+  count  = var.enable_reingestion_checkpoints ? 1 : 0
+  name   = "audit_logs_reingestion_checkpoints_policy"
+  policy = data.template_file.reingestion_checkpoints_policy_template[0].rendered
+}
+
+resource "aws_iam_role_policy_attachment" "reingestion_checkpoints_policy_attachment" {
+  count      = var.enable_reingestion_checkpoints ? 1 : 0
+  policy_arn = aws_iam_policy.reingestion_checkpoints_policy[0].arn
+  role       = aws_iam_role.lambda_role.name
+}
+
 
 resource "aws_iam_role" "transformation_lambda_invoke_role" {
   name               = "audit_logs_transformation_lambda_invoke_role"
@@ -35,9 +35,25 @@ resource "aws_lambda_function" "s3_to_firehose_lambda" {
   source_code_hash = filebase64sha256(data.archive_file.s3_to_firehose_archive.output_path)
   memory_size      = 256
   timeout          = 90
+  layers           = var.lambda_layers
   environment {
     variables = {
-      Firehose = aws_kinesis_firehose_delivery_stream.audit_logs_stream.name
+      Firehose            = aws_kinesis_firehose_delivery_stream.audit_logs_stream.name,
+      record_target_size  = var.record_target_size,
+      metrics_enabled     = var.enable_metrics,
+      profile_sample_rate = var.profiling_sample_rate,
+      profile_mode        = var.profiling_mode
+    }
+  }
+}
+
+resource "aws_lambda_function_event_invoke_config" "s3_to_firehose_lambda_invoke_config" {
+  function_name          = aws_lambda_function.s3_to_firehose_lambda.function_name
+  maximum_retry_attempts = 2
+
+  destination_config {
+    on_failure {
+      destination = aws_sqs_queue.lambda_failures.arn
     }
   }
 }
@@ -57,12 +73,32 @@ resource "aws_lambda_function" "splashback_retry_lambda" {
   source_code_hash = filebase64sha256(data.archive_file.reingestion_lambda_archive.output_path)
   memory_size      = 256
   timeout          = 90
+  layers           = var.lambda_layers
 
   environment {
     variables = {
-      Firehose   = aws_kinesis_firehose_delivery_stream.audit_logs_stream.name,
-      Region     = "eu-west-2",
-      max_ingest = 3
+      Firehose               = aws_kinesis_firehose_delivery_stream.audit_logs_stream.name,
+      Region                 = "eu-west-2",
+      max_ingest             = 3,
+      max_in_flight_batches  = var.reingestion_lambda_max_in_flight_batches,
+      compress_failed_events = var.compress_failed_events,
+      checkpoint_table       = var.enable_reingestion_checkpoints ? aws_dynamodb_table.reingestion_checkpoints[0].name : "",
+      metrics_enabled        = var.enable_metrics,
+      profile_sample_rate    = var.profiling_sample_rate,
+      profile_mode           = var.profiling_mode
+    }
+  }
+}
+
+# A retry resumes from the checkpoint after the deadline, so an object that
+# needs more than three invocations ends up in the failure queue.
+resource "aws_lambda_function_event_invoke_config" "splashback_retry_lambda_invoke_config" {
+  function_name          = aws_lambda_function.splashback_retry_lambda.function_name
+  maximum_retry_attempts = 2
+
+  destination_config {
+    on_failure {
+      destination = aws_sqs_queue.lambda_failures.arn
     }
   }
 }
@@ -75,15 +111,22 @@ resource "aws_lambda_function" "transformation_lambda" {
   handler          = "transformation_lambda.transformation_lambda.lambda_handler"
   runtime          = "python3.9"
   source_code_hash = filebase64sha256(data.archive_file.transformation_lambda_archive.output_path)
-  memory_size      = 256
+  memory_size      = var.transformation_lambda_memory_size
   timeout          = 90
+  layers           = var.lambda_layers
   environment {
     variables = {
-      splunk_host       = var.splunk_host,
-      splunk_source     = var.splunk_source,
-      splunk_sourcetype = var.splunk_sourcetype,
-      splunk_index      = var.splunk_index,
-      timestamp_key     = var.timestamp_key
+      splunk_host         = var.splunk_host,
+      splunk_source       = var.splunk_source,
+      splunk_sourcetype   = var.splunk_sourcetype,
+      splunk_index        = var.splunk_index,
+      timestamp_key       = var.timestamp_key,
+      compact_json        = var.compact_json,
+      parallel_processes  = var.transformation_lambda_parallel_processes,
+      invalid_line_mode   = var.invalid_line_mode,
+      metrics_enabled     = var.enable_metrics,
+      profile_sample_rate = var.profiling_sample_rate,
+      profile_mode        = var.profiling_mode
     }
   }
 }
@@ -12,6 +12,6 @@ locals {
   reingestion_lambda_included_files = fileset("${path.module}/../lambda/", "{reingestion_lambda,utils}/**")
   reingestion_lambda_excluded_files = [for f in local.all_lambdas : f if !contains(local.reingestion_lambda_included_files, f)]
 
-  s3_to_firehose_included_files = fileset("${path.module}/../lambda/", "s3_to_firehose/**")
+  s3_to_firehose_included_files = fileset("${path.module}/../lambda/", "{s3_to_firehose,utils}/**")
   s3_to_firehose_excluded_files = [for f in local.all_lambdas : f if !contains(local.s3_to_firehose_included_files, f)]
 }
@@ -0,0 +1,5 @@
+resource "aws_sqs_queue" "lambda_failures" {
+  name                      = "audit_logs_lambda_failures"
+  message_retention_seconds = 1209600
+  sqs_managed_sse_enabled   = true
+}
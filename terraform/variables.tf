@@ -44,6 +44,87 @@ variable "timestamp_key" {
   description = "The object key where the timestamp of the log event is located."
 }
 
+variable "compact_json" {
+  type        = bool
+  description = "Whether to send events to Splunk as compact JSON, without spaces after separators."
+  default     = false
+}
+
+variable "transformation_lambda_memory_size" {
+  type        = number
+  description = "The memory size of the transformation Lambda in MB. Above 1769 MB the function gets more than one vCPU."
+  default     = 256
+}
+
+variable "transformation_lambda_parallel_processes" {
+  type        = number
+  description = "The number of processes the transformation Lambda spreads records over. Values of 0 or 1 process records serially."
+  default     = 0
+}
+
+variable "reingestion_lambda_max_in_flight_batches" {
+  type        = number
+  description = "The number of PutRecordBatch calls the reingestion Lambda can have in flight per object while it keeps parsing. A value of 1 sends batches synchronously."
+  default     = 4
+}
+
+variable "compress_failed_events" {
+  type        = bool
+  description = "Whether events that were reingested too many times are gzipped when written to SplashbackRawFailed/. Compressed objects get a .gz suffix."
+  default     = false
+}
+
+variable "enable_reingestion_checkpoints" {
+  type        = bool
+  description = "Whether the reingestion Lambda records its progress through each object in a DynamoDB table, so a retry after a timeout resumes where it stopped instead of resending the whole object. Objects it finished are skipped by retries until their checkpoint expires after 7 days."
+  default     = false
+}
+
+variable "invalid_line_mode" {
+  type        = string
+  description = "How the transformation Lambda handles a line it cannot transform. fail_record returns the line's whole record as ProcessingFailed so Firehose writes it to the splashback bucket, wrap_raw sends the line to Splunk as a string event."
+  default     = "fail_record"
+
+  validation {
+    condition     = contains(["fail_record", "wrap_raw"], var.invalid_line_mode)
+    error_message = "invalid_line_mode must be fail_record or wrap_raw."
+  }
+}
+
+variable "enable_metrics" {
+  type        = bool
+  description = "Whether each Lambda prints its per-invocation metrics (stage timings, bytes, reingest and retry counts) as a CloudWatch embedded metric format log line, in the S3ToSplunkUpload namespace."
+  default     = false
+}
+
+variable "profiling_sample_rate" {
+  type        = number
+  description = "The fraction of invocations, between 0 and 1, that each Lambda profiles and writes the top functions of to its logs. 0 turns profiling off."
+  default     = 0
+
+  validation {
+    condition     = var.profiling_sample_rate >= 0 && var.profiling_sample_rate <= 1
+    error_message = "profiling_sample_rate must be between 0 and 1."
+  }
+}
+
+variable "profiling_mode" {
+  type        = string
+  description = "What a profiled invocation records. cpu uses cProfile, memory uses tracemalloc and cpu_and_memory uses both, although tracing memory slows the CPU profile down."
+  default     = "cpu"
+
+  validation {
+    condition     = contains(["cpu", "memory", "cpu_and_memory"], var.profiling_mode)
+    error_message = "profiling_mode must be cpu, memory or cpu_and_memory."
+  }
+}
+
+variable "lambda_layers" {
+  type        = list(string)
+  description = "Lambda layer ARNs to add to every function, for example a layer providing orjson for faster JSON handling."
+  default     = []
+}
+
 variable "retention_mode" {
   type        = string
   description = "The retention mode to use for the S3 bucket. Valid values are COMPLIANCE and GOVERNANCE."
@@ -61,3 +142,9 @@ variable "lifecycle_expiration" {
   description = "The expiration value for the lifecycle policy. This value is in days."
   default     = 365
 }
+
+variable "record_target_size" {
+  type        = number
+  description = "When greater than 0, objects are split on new lines into Firehose records of roughly this many bytes, measured after compression for gzipped objects. The maximum is 1024000. Lines that do not fit in a record are written to SplashbackRawFailed/<key>.oversized in the audit logs bucket."
+  default     = 0
+}